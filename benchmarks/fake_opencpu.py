@@ -0,0 +1,340 @@
+###############################################################################
+# Caleydo - Visualization for Molecular Biology - http://caleydo.org
+# Copyright (c) The Caleydo Team. All rights reserved.
+# Licensed under the new BSD license, available at http://caleydo.org/license
+###############################################################################
+"""
+local stand-in for an OpenCPU server serving synthetic datasets. It understands the requests issued by
+phovea_data_opencpu: session creation, the phoveaDatasets description, values, subsets and dimnames in the json and
+rds output formats.
+"""
+
+from __future__ import print_function
+from collections import OrderedDict
+import itertools
+import json
+import re
+import struct
+import threading
+import time
+import numpy as np
+
+try:
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+  from socketserver import ThreadingMixIn
+  from urllib.parse import parse_qs, urlparse
+except ImportError:  # python 2
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+  from SocketServer import ThreadingMixIn
+  from urlparse import parse_qs, urlparse
+
+__author__ = 'Samuel Gratzl'
+
+NA_INTEGER = -2147483648
+_text = (str, type(u''))
+
+
+class Table(object):
+  def __init__(self, columns, rows):
+    self.columns = columns  # OrderedDict of name to numpy array
+    self.rows = rows
+
+  @property
+  def shape(self):
+    return [len(self.rows), len(self.columns)]
+
+
+class Matrix(object):
+  def __init__(self, values, rows, cols):
+    self.values = values
+    self.rows = rows
+    self.cols = cols
+
+
+def synthetic_datasets(table_shape=(1000, 100), vector_length=100000, matrix_shape=(2000, 500), seed=42):
+  """
+  generates a wide table, a tall vector and a matrix of the given shapes
+  """
+  rnd = np.random.RandomState(seed)
+  rows, cols = table_shape
+  columns = OrderedDict()
+  for i in range(cols):
+    if i % 2 == 0:
+      columns['c{i}'.format(i=i)] = rnd.rand(rows)
+    else:
+      columns['c{i}'.format(i=i)] = rnd.randint(0, 1000, size=rows).astype(np.int32)
+  return OrderedDict([('table', Table(columns, ['r{i}'.format(i=i) for i in range(rows)])),
+                      ('vector', rnd.rand(vector_length)),
+                      ('matrix', Matrix(rnd.rand(*matrix_shape), ['m{i}'.format(i=i) for i in range(matrix_shape[0])],
+                                        ['s{i}'.format(i=i) for i in range(matrix_shape[1])]))])
+
+
+# R serialization writer, the inverse of phovea_data_opencpu.rds
+
+def _int(v):
+  return struct.pack('>i', v)
+
+
+def _charsxp(s):
+  if s is None:
+    return _int(9) + _int(-1)
+  raw = s.encode('utf-8')
+  return _int(9 | ((1 << 3) << 12)) + _int(len(raw)) + raw
+
+
+def _attributes(attrs):
+  r = b''
+  for name, value in attrs.items():
+    r += _int(2 | (1 << 10)) + _int(1) + _charsxp(name) + _item(value)
+  return r + _int(254)
+
+
+def _header(sexptype, attrs):
+  flags = sexptype
+  if attrs:
+    flags |= 1 << 9
+    if 'class' in attrs:
+      flags |= 1 << 8
+  return _int(flags)
+
+
+def _item(value, attrs=None):
+  if value is None:
+    return _int(254)
+  if isinstance(value, dict):
+    attrs = OrderedDict(attrs or [])
+    attrs['names'] = list(value.keys())
+    value = [_item(v) for v in value.values()]
+    body = _header(19, attrs) + _int(len(value)) + b''.join(value)
+    return body + _attributes(attrs)
+  if isinstance(value, _text):
+    value = [value]
+  elif isinstance(value, (bool, int, float, np.integer, np.floating)):
+    value = np.array([value])
+  if isinstance(value, list):
+    if all(v is None or isinstance(v, _text) for v in value):
+      body = _header(16, attrs) + _int(len(value)) + b''.join(_charsxp(v) for v in value)
+    elif all(isinstance(v, (int, float)) for v in value):
+      return _item(np.array(value), attrs)
+    else:
+      body = _header(19, attrs) + _int(len(value)) + b''.join(_item(v) for v in value)
+  elif value.dtype.kind in 'iub':
+    body = _header(13, attrs) + _int(value.size) + value.ravel(order='F').astype('>i4').tobytes()
+  elif value.dtype.kind == 'f':
+    body = _header(14, attrs) + _int(value.size) + value.ravel(order='F').astype('>f8').tobytes()
+  else:
+    return _item([None if v is None else str(v) for v in value.ravel(order='F')], attrs)
+  if attrs:
+    body += _attributes(attrs)
+  return body
+
+
+def to_rds(value):
+  if isinstance(value, Table):
+    n = len(value.rows)
+    attrs = OrderedDict([('names', list(value.columns.keys())), ('class', ['data.frame']),
+                         ('row.names', np.array([NA_INTEGER, -n], dtype=np.int32))])
+    body = _item(list(value.columns.values()), attrs)
+  elif isinstance(value, np.ndarray) and value.ndim == 2:
+    body = _item(value, OrderedDict([('dim', np.array(value.shape, dtype=np.int32))]))
+  else:
+    body = _item(value)
+  return b'X\n' + _int(2) + _int(0x030602) + _int(0x020300) + body
+
+
+def to_json(value):
+  if isinstance(value, Table):
+    names = list(value.columns.keys())
+    data = [dict(zip(names, row)) for row in zip(*[c.tolist() for c in value.columns.values()])]
+  elif isinstance(value, np.ndarray):
+    data = value.tolist()
+  else:
+    data = value
+  return json.dumps(data).encode('utf-8')
+
+
+def _known_type(values):
+  if values.dtype.kind in 'iu':
+    return 'int'
+  if values.dtype.kind == 'f':
+    return 'real'
+  return 'string'
+
+
+def describe(datasets, boxed=False):
+  """
+  the phoveaDatasets description of the given datasets
+  :param boxed: wrap scalars in lists like jsonlite does
+  """
+  def box(v):
+    return [v] if boxed else v
+
+  def value_desc(values):
+    return dict(type=box(_known_type(values)), min=box(float(values.min())), max=box(float(values.max())))
+
+  r = OrderedDict()
+  for name, d in datasets.items():
+    if isinstance(d, Table):
+      values = list(d.columns.values())
+      r[name] = OrderedDict([('name', box(name)), ('size', d.shape), ('type', box('table')),
+                             ('columns', OrderedDict([('names', list(d.columns.keys())),
+                                                      ('types', [_known_type(v) for v in values]),
+                                                      ('min', [float(v.min()) for v in values]),
+                                                      ('max', [float(v.max()) for v in values])]))])
+    elif isinstance(d, Matrix):
+      r[name] = OrderedDict([('name', box(name)), ('size', list(d.values.shape)), ('type', box('matrix')),
+                             ('value', value_desc(d.values))])
+    else:
+      r[name] = OrderedDict([('name', box(name)), ('size', [len(d)]), ('type', box('vector')),
+                             ('value', value_desc(d))])
+  return r
+
+
+def _split_args(s):
+  args, depth, current = [], 0, ''
+  for ch in s:
+    if ch == ',' and depth == 0:
+      args.append(current.strip())
+      current = ''
+      continue
+    depth += ch == '(' or ch == '['
+    depth -= ch == ')' or ch == ']'
+    current += ch
+  args.append(current.strip())
+  return [a for a in args if not a.startswith('drop=')]
+
+
+def _parse_index(arg, names):
+  if arg == '':
+    return None
+  if arg.startswith('c(') and arg.endswith(')'):
+    return list(itertools.chain(*[_parse_index(a, names) for a in _split_args(arg[2:-1])]))
+  if arg == 'integer(0)':
+    return []
+  if arg[0] in '\'"':
+    return [names.index(arg[1:-1])]
+  if ':' in arg:
+    a, b = arg.split(':')
+    return list(range(int(a) - 1, int(b)))
+  return [int(arg) - 1]
+
+
+class FakeOpenCPU(object):
+  """
+  serves the given datasets under a single R script, every session creation returns a new session key
+  """
+
+  def __init__(self, datasets, latency=0.):
+    self.datasets = datasets
+    self.latency = latency
+    self.requests = 0
+    self._sessions = itertools.count()
+    self._lock = threading.Lock()
+    self._server = None
+
+  def _resolve(self, expr):
+    m = re.match(r'^(\w+)::(\w+)(?:\[(.*)\])?$', expr.strip(), re.S)
+    if m is None:
+      raise ValueError('unsupported expression: ' + expr)
+    d = self.datasets[m.group(2)]
+    if m.group(3) is None:
+      return d
+    args = _split_args(m.group(3))
+    if isinstance(d, Table):
+      names = list(d.columns.keys())
+      rows = _parse_index(args[0], d.rows)
+      cols = _parse_index(args[1], names) if len(args) > 1 else None
+      selected = names if cols is None else [names[i] for i in cols]
+      return Table(OrderedDict((n, d.columns[n] if rows is None else d.columns[n][rows]) for n in selected),
+                   d.rows if rows is None else [d.rows[i] for i in rows])
+    if isinstance(d, Matrix):
+      rows = _parse_index(args[0], d.rows)
+      cols = _parse_index(args[1], d.cols) if len(args) > 1 else None
+      values = d.values if rows is None else d.values[rows]
+      return values if cols is None else values[:, cols]
+    rows = _parse_index(args[0], [])
+    return d if rows is None else d[rows]
+
+  def _dimnames(self, expr):
+    d = self._resolve(expr)
+    if isinstance(d, Table):
+      return [d.rows, list(d.columns.keys())]
+    if isinstance(d, Matrix):
+      return [d.rows, d.cols]
+    return None
+
+  def handle(self, method, path, args):
+    """
+    :return: (status, content type, body)
+    """
+    with self._lock:
+      self.requests += 1
+    if self.latency:
+      time.sleep(self.latency)
+    path = path[len('/ocpu/'):] if path.startswith('/ocpu/') else path.lstrip('/')
+    parts = path.rstrip('/').split('/')
+    fmt = parts[-1]
+
+    if path.startswith('library/base/R/eval'):
+      key = 'x{i:08x}'.format(i=next(self._sessions))
+      text = '/ocpu/tmp/{k}/R/.val\n/ocpu/tmp/{k}/R/phoveaDatasets\n'.format(k=key)
+      return 201, 'text/plain', text.encode('utf-8')
+    if path.startswith('library/base/R/list.files'):
+      return 200, 'application/json', b'[]'
+    if parts[0] == 'tmp' and len(parts) >= 5 and parts[2] == 'R':
+      variable = parts[3]
+      if variable == 'phoveaDatasets':
+        value = describe(self.datasets, boxed=fmt == 'json')
+      else:
+        value = self.datasets[variable]
+    elif path.startswith('library/base/R/identity'):
+      value = self._resolve(args['x'])
+    elif path.startswith('library/base/R/dimnames'):
+      value = self._dimnames(args['x'])
+    else:
+      return 404, 'text/plain', b'not found'
+
+    if isinstance(value, Matrix):
+      value = value.values
+    if fmt == 'rds':
+      return 201 if method == 'POST' else 200, 'application/octet-stream', to_rds(value)
+    return 201 if method == 'POST' else 200, 'application/json', to_json(value)
+
+  def start(self, port=0):
+    fake = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def _respond(self, method, args):
+        status, content_type, body = fake.handle(method, urlparse(self.path).path, args)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def do_GET(self):
+        self._respond('GET', dict())
+
+      def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        self._respond('POST', {k: v[0] for k, v in parse_qs(body).items()})
+
+      def log_message(self, *args):
+        pass
+
+    class Server(ThreadingMixIn, HTTPServer):
+      daemon_threads = True
+
+    self._server = Server(('127.0.0.1', port), Handler)
+    thread = threading.Thread(target=self._server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return self._server.server_address[1]
+
+  def stop(self):
+    if self._server is not None:
+      self._server.shutdown()
+      self._server.server_close()
@@ -0,0 +1,194 @@
+###############################################################################
+# Caleydo - Visualization for Molecular Biology - http://caleydo.org
+# Copyright (c) The Caleydo Team. All rights reserved.
+# Licensed under the new BSD license, available at http://caleydo.org/license
+###############################################################################
+"""
+benchmarks the OpenCPU data provider against a local fake OpenCPU server
+
+  python benchmarks/run.py --output results.json
+  python benchmarks/run.py --compare results.json
+
+the results are recorded as JSON such that runs of different commits can be compared
+"""
+
+from __future__ import print_function
+from collections import OrderedDict
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+here = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(here))
+sys.path.insert(0, here)
+
+from fake_opencpu import FakeOpenCPU, synthetic_datasets  # noqa: E402
+
+__author__ = 'Samuel Gratzl'
+
+
+class _Config(object):
+  """
+  replaces the phovea_server configuration view of the provider modules
+  """
+
+  def __init__(self, values):
+    self._values = values
+
+  def __getattr__(self, item):
+    return self._values.get(item)
+
+
+class _Slice(object):
+  def __init__(self, s):
+    self._s = s
+
+  def asslice(self):
+    return self._s
+
+
+class _Range(object):
+  """
+  minimal stand-in for a phovea range: one slice per dimension
+  """
+
+  def __init__(self, *slices):
+    self._slices = slices
+
+  def __getitem__(self, item):
+    return _Slice(self._slices[item] if item < len(self._slices) else slice(None))
+
+
+def _configure(port, args):
+  from phovea_data_opencpu import api, cache, client, data_provider, offload
+  config = _Config(dict(host='127.0.0.1', port=port, format=args.format, subset_threshold=0.5, keepalive_interval=0,
+                        bootstrap_workers=args.sessions,
+                        transport=dict(pool_maxsize=16, read_timeout=600),
+                        sessions=[dict(name='bench{i}'.format(i=i), script='bench()') for i in range(args.sessions)]))
+  for module in (api, cache, client, data_provider, offload):
+    module.config = config
+  client._session = None
+  cache._values = None
+  cache._disk = None
+  api._responses = None
+  return data_provider
+
+
+def _timeit(f, repeat, setup=None):
+  times = []
+  for _ in range(repeat):
+    if setup is not None:
+      setup()
+    start = time.time()
+    f()
+    times.append(time.time() - start)
+  return OrderedDict([('min', min(times)), ('mean', sum(times) / len(times)), ('max', max(times)),
+                      ('repeat', repeat)])
+
+
+def _git_head():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--verify', 'HEAD'], cwd=here).strip().decode('utf-8')
+  except (subprocess.CalledProcessError, OSError):
+    return None
+
+
+def run(args):
+  from phovea_data_opencpu import cache
+  datasets = synthetic_datasets(tuple(args.table), args.vector, tuple(args.matrix))
+  fake = FakeOpenCPU(datasets, latency=args.latency / 1000.)
+  port = fake.start()
+  try:
+    data_provider = _configure(port, args)
+    results = OrderedDict()
+
+    results['startup'] = _timeit(data_provider.create, args.repeat)
+    provider = data_provider.create()
+    entries = {e.name: e for e in provider.by_session('bench0')}
+    table, vector, matrix = entries['table'], entries['vector'], entries['matrix']
+
+    def clear():
+      cache.values().invalidate()
+
+    results['table_full'] = _timeit(table.aspandas, args.repeat, clear)
+    results['table_column'] = _timeit(lambda: table.columns[0].asnumpy(), args.repeat, clear)
+    results['table_range'] = _timeit(lambda: table.aspandas(_Range(slice(0, 100), slice(0, 10))), args.repeat, clear)
+    results['vector_full'] = _timeit(vector.asnumpy, args.repeat, clear)
+    results['vector_range'] = _timeit(lambda: vector.asnumpy(_Range(slice(0, 1000))), args.repeat, clear)
+    results['matrix_full'] = _timeit(matrix.asnumpy, args.repeat, clear)
+    results['matrix_range'] = _timeit(lambda: matrix.asnumpy(_Range(slice(0, 200), slice(0, 50))), args.repeat,
+                                      clear)
+    results['dim_names'] = _timeit(lambda: (matrix.rows(), matrix.cols()), args.repeat, clear)
+
+    counter = [0]
+
+    def manager(names, idtype):
+      ids = list(range(counter[0], counter[0] + len(names)))
+      counter[0] += len(names)
+      return ids
+
+    names = matrix.rows()
+    id_map = [None]
+    results['assign_ids_unseen'] = _timeit(lambda: id_map[0](names), args.repeat,
+                                           lambda: id_map.__setitem__(0, data_provider.IDMap('Bench', manager)))
+    results['assign_ids_known'] = _timeit(lambda: id_map[0](names), args.repeat)
+
+    try:
+      from phovea_data_opencpu import api
+      proxy = api.app.test_client()
+      key = table._session.key
+      results['proxy'] = _timeit(lambda: [proxy.get('/tmp/{k}/R/vector/json'.format(k=key)).data
+                                          for _ in range(args.proxy_requests)], args.repeat,
+                                 lambda: api._response_cache().invalidate())
+      results['proxy']['requests'] = args.proxy_requests
+    except Exception as e:  # the proxy requires a flask based phovea_server
+      print('skipping proxy benchmark: {e}'.format(e=e), file=sys.stderr)
+
+    return OrderedDict([('commit', _git_head()), ('timestamp', time.time()), ('parameters', vars(args)),
+                        ('requests', fake.requests), ('results', results)])
+  finally:
+    fake.stop()
+
+
+def compare(current, baseline):
+  print('{n:<20} {b:>12} {c:>12} {r:>8}'.format(n='benchmark', b='baseline', c='current', r='ratio'))
+  for name, r in current['results'].items():
+    b = baseline['results'].get(name)
+    if b is None:
+      print('{n:<20} {b:>12} {c:>12.4f}'.format(n=name, b='-', c=r['min']))
+      continue
+    print('{n:<20} {b:>12.4f} {c:>12.4f} {r:>8.2f}'.format(n=name, b=b['min'], c=r['min'], r=r['min'] / b['min']))
+
+
+def main():
+  parser = argparse.ArgumentParser(description='benchmarks phovea_data_opencpu against a fake OpenCPU server')
+  parser.add_argument('--table', type=int, nargs=2, default=[10000, 200], metavar=('ROWS', 'COLS'))
+  parser.add_argument('--vector', type=int, default=1000000, metavar='LENGTH')
+  parser.add_argument('--matrix', type=int, nargs=2, default=[5000, 1000], metavar=('ROWS', 'COLS'))
+  parser.add_argument('--sessions', type=int, default=4, help='number of sessions created on startup')
+  parser.add_argument('--latency', type=float, default=0, help='injected latency per request in ms')
+  parser.add_argument('--format', default='rds', choices=['rds', 'json'])
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument('--proxy-requests', type=int, default=20)
+  parser.add_argument('--output', help='file to write the results to')
+  parser.add_argument('--compare', help='results file of a previous run to compare with')
+  args = parser.parse_args()
+
+  results = run(args)
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2)
+  if args.compare:
+    with open(args.compare, 'r') as f:
+      compare(results, json.load(f))
+  else:
+    print(json.dumps(results['results'], indent=2))
+
+
+if __name__ == '__main__':
+  np.seterr(all='ignore')
+  main()
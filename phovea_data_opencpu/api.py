@@ -4,29 +4,259 @@
 # Licensed under the new BSD license, available at http://caleydo.org/license
 ###############################################################################
 
-from phovea_server.ns import Namespace, abort, Response
-import requests
+from phovea_server.ns import Namespace, abort, Response, jsonify, request
+from . import cache, client, metrics
+import hashlib
 import logging
+import re
+import phovea_server
 
 app = Namespace(__name__)
 _log = logging.getLogger(__name__)
+config = phovea_server.config.view('phovea_data_opencpu')
+
+_CHUNK_SIZE = 64 * 1024
+# request headers passed on to OpenCPU
+_FORWARDED_HEADERS = frozenset(['accept', 'accept-encoding', 'content-type', 'if-none-match', 'if-modified-since'])
+# connection specific response headers that must not be passed back to the client
+_HOP_BY_HOP_HEADERS = frozenset(['connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailer',
+                                 'transfer-encoding', 'upgrade', 'content-type'])
+_session_path = re.compile(r'^/?tmp/[^/]+/')
+# upper bound of the number of histogram bins computed in R
+_MAX_BINS = 1000
 
 
 def _to_full_url(path):
-  from phovea_server.config import view
-  c = view('phovea_data_opencpu')
-  return 'http://{host}:{port}/ocpu/{path}'.format(host=c.host, port=c.port, path=path)
+  return client.to_url(path)
+
+
+@app.route('/_cache', methods=['GET'])
+def _cache_stats():
+  return jsonify(cache.values().stats())
+
+
+@app.route('/_cache', methods=['DELETE'])
+@app.route('/_cache/<session>', methods=['DELETE'])
+def _invalidate_cache(session=None):
+  from . import data_provider
+  p = data_provider.provider()
+  if p is not None:
+    removed = p.invalidate(session)
+  else:
+    removed = cache.values().invalidate() if session is None else 0
+  _log.info('invalidated %d cached values of session %s', removed, session or '<all>')
+  return jsonify(dict(removed=removed))
+
+
+@app.route('/_metrics', methods=['GET'])
+def _metrics():
+  """
+  timing histograms and counters in the Prometheus text format
+  """
+  return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class _CachedResponse(object):
+  def __init__(self, status, headers, content_type, etag, body):
+    self.status = status
+    self.headers = headers
+    self.content_type = content_type
+    self.etag = etag
+    self.body = body
+
+  @property
+  def nbytes(self):
+    return len(self.body)
+
+
+_responses = None
+
+
+def _response_cache():
+  global _responses
+  if _responses is None:
+    c = config.proxy_cache or dict()
+    _responses = cache.ValueCache(c.get('max_bytes', 256 * 1024 * 1024), name='proxy')
+  return _responses
+
+
+def _is_immutable(path):
+  """
+  objects of an OpenCPU session never change once the session is created
+  """
+  return _session_path.match(path) is not None
+
+
+def _cache_headers(immutable, etag):
+  headers = [('Cache-Control', 'public, max-age=31536000, immutable' if immutable else 'no-cache')]
+  if etag:
+    headers.append(('ETag', etag))
+  return headers
+
 
+def _from_cache(cached, immutable):
+  headers = _cache_headers(immutable, cached.etag)
+  if cached.etag and cached.etag in request.headers.get('If-None-Match', ''):
+    return Response(status=304, headers=headers)
+  return Response(cached.body, status=cached.status, headers=cached.headers + headers,
+                  content_type=cached.content_type)
 
-@app.route('/<path:path>')
+
+def _fetch_json(path):
+  r = client.get(path, label='batch')
+  if r.status_code == 200:
+    try:
+      return dict(status=r.status_code, data=r.json())
+    except ValueError:  # not a JSON resource, e.g., a plain text or binary output format
+      pass
+  return dict(status=r.status_code, data=r.text)
+
+
+@app.route('/_rediscover', methods=['POST'])
+def _rediscover():
+  from . import data_provider
+  p = data_provider.provider()
+  if p is None:
+    abort(404)
+  return jsonify(p.rediscover())
+
+
+@app.route('/_datasets', methods=['GET'])
+def _datasets():
+  """
+  lists the descriptions of the OpenCPU datasets, optionally filtered by type, session and idtype
+  """
+  from . import data_provider
+  p = data_provider.provider()
+  if p is None:
+    abort(404)
+  body = p.descriptions_json(request.args.get('type'), request.args.get('session'), request.args.get('idtype'))
+  return Response(body, content_type='application/json')
+
+
+@app.route('/_aggregate/<dataset_id>/<kind>', methods=['GET'])
+def _aggregate(dataset_id, kind):
+  """
+  computes an aggregation (stats, hist or value_counts) of a dataset in R, supported arguments: range, column (tables
+  only) and bins (hist only, at most _MAX_BINS)
+  """
+  from . import data_provider
+  p = data_provider.provider()
+  dataset = None if p is None else p[dataset_id]
+  if dataset is None or kind not in ('stats', 'hist', 'value_counts'):
+    abort(404)
+  kwargs = dict()
+  if 'range' in request.args:
+    from phovea_server.range import parse
+    try:
+      kwargs['range'] = parse(request.args['range'])
+    except Exception as e:
+      abort(400, 'invalid range: {e}'.format(e=e))
+  if 'column' in request.args:
+    column = request.args['column']
+    if dataset.type != 'table':
+      abort(400, 'column is only supported for tables')
+    if column not in [c.column for c in dataset.columns]:
+      abort(400, 'unknown column: {c}'.format(c=column))
+    kwargs['column'] = column
+  if kind == 'hist':
+    try:
+      bins = int(request.args.get('bins', 10))
+    except ValueError:
+      bins = 0
+    if not 1 <= bins <= _MAX_BINS:
+      abort(400, 'bins has to be an integer between 1 and {m}'.format(m=_MAX_BINS))
+    kwargs['bins'] = bins
+  return jsonify(getattr(dataset, kind)(**kwargs))
+
+
+@app.route('/_batch', methods=['POST'])
+def _batch():
+  """
+  fetches several OpenCPU paths concurrently, expects a JSON body {"paths": [...]}
+  """
+  paths = (request.get_json(force=True) or dict()).get('paths', [])
+  results = client.gather([(_fetch_json, (p,)) for p in paths])
+  return jsonify(dict(zip(paths, results)))
+
+
+def _stream(r, store=None):
+  chunks = [] if store else None
+  size = 0
+  max_size = (config.proxy_cache or dict()).get('max_entry_bytes', 16 * 1024 * 1024)
+  try:
+    # pass the body through as it is, including its content encoding
+    for chunk in r.raw.stream(_CHUNK_SIZE, decode_content=False):
+      metrics.count('proxy_bytes_total', len(chunk))
+      if chunks is not None:
+        size += len(chunk)
+        chunks = chunks if size <= max_size else None
+        if chunks is not None:
+          chunks.append(chunk)
+      yield chunk
+    if chunks is not None:
+      store(b''.join(chunks))
+  finally:
+    # also called if the client disconnects
+    r.close()
+
+
+@app.route('/<path:path>', methods=['GET', 'POST'])
 def _handle(path):
   _log.info('proxy request url: %s', path)
   url = _to_full_url(path)
   if url:
     _log.info('proxy request url: %s', url)
-    r = requests.get(url)
+    headers = {k: v for k, v in request.headers.items() if k.lower() in _FORWARDED_HEADERS}
+    if not any(k.lower() == 'accept-encoding' for k in headers):
+      # otherwise the HTTP session adds its default, passing compressed bodies to a client that cannot decode them
+      headers['Accept-Encoding'] = 'identity'
+    params = list(request.args.items(multi=True))
+
+    if request.method != 'GET':
+      with metrics.span('proxy', method=request.method):
+        r = client.request(request.method, path, label='proxy', params=params, headers=headers,
+                           data=request.get_data(), stream=True)
+      _log.info('proxy response status code: %s', r.status_code)
+      response_headers = [(k, v) for k, v in r.headers.items() if k.lower() not in _HOP_BY_HOP_HEADERS]
+      return Response(_stream(r), status=r.status_code, headers=response_headers,
+                      content_type=r.headers.get('content-type'), direct_passthrough=True)
+
+    immutable = _is_immutable(path)
+    encoding = next(v for k, v in headers.items() if k.lower() == 'accept-encoding')
+    key = ('proxy', path, request.query_string, encoding)
+    cached = _response_cache().get(key)
+    if cached is not None:
+      if immutable:
+        return _from_cache(cached, immutable)
+      # revalidate with OpenCPU
+      headers['If-None-Match'] = cached.etag
+    with metrics.span('proxy', method='GET'):
+      r = client.request('GET', path, label='proxy', params=params, headers=headers, stream=True)
     _log.info('proxy response status code: %s', r.status_code)
-    return Response(r.text, status=r.status_code, content_type=r.headers['content-type'])
+    if cached is not None and r.status_code == 304:
+      r.close()
+      return _from_cache(cached, immutable)
+
+    response_headers = [(k, v) for k, v in r.headers.items()
+                        if k.lower() not in _HOP_BY_HOP_HEADERS and k.lower() != 'etag']
+    etag = r.headers.get('ETag')
+    if not etag and immutable:
+      etag = '"{h}"'.format(h=hashlib.sha1(url.encode('utf-8') + b'?' + request.query_string).hexdigest())
+    on_complete = None
+    if r.status_code == 200 and etag:
+      content_type = r.headers.get('content-type')
+      cached_headers = list(response_headers)
+
+      def cache_response(body):
+        _response_cache().put(key, _CachedResponse(r.status_code, cached_headers, content_type, etag, body))
+
+      on_complete = cache_response
+      response_headers = response_headers + _cache_headers(immutable, etag)
+    elif etag:
+      response_headers.append(('ETag', etag))
+    return Response(_stream(r, on_complete), status=r.status_code, headers=response_headers,
+                    content_type=r.headers.get('content-type'), direct_passthrough=True)
   abort(404)
 
 
@@ -0,0 +1,354 @@
+###############################################################################
+# Caleydo - Visualization for Molecular Biology - http://caleydo.org
+# Copyright (c) The Caleydo Team. All rights reserved.
+# Licensed under the new BSD license, available at http://caleydo.org/license
+###############################################################################
+
+from logging import getLogger
+from collections import OrderedDict
+import os
+import threading
+import time
+import phovea_server
+from . import metrics
+
+__author__ = 'Samuel Gratzl'
+_log = getLogger(__name__)
+config = phovea_server.config.view('phovea_data_opencpu')
+
+
+def cache_dir():
+  """
+  :return: the directory for persisted caches
+  """
+  import tempfile
+  return config.cache_dir or os.path.join(tempfile.gettempdir(), 'phovea_data_opencpu')
+
+
+def _object_nbytes(values, sample=1000):
+  """
+  estimates the size of the Python objects referenced by an object array from an evenly spaced sample
+  """
+  import sys
+  flat = values.ravel()
+  if len(flat) == 0:
+    return 0
+  step = max(1, len(flat) // sample)
+  picked = flat[::step]
+  return sum(sys.getsizeof(v) for v in picked) * len(flat) // len(picked)
+
+
+def nbytes(value):
+  """
+  estimates the memory used by the given value including the Python objects of object arrays
+  :param value: numpy array, pandas object, dict or list of them, e.g., aggregation results, or other
+  :return: number of bytes
+  """
+  import sys
+  if hasattr(value, 'memory_usage'):  # pandas DataFrame, Series or Categorical
+    usage = value.memory_usage(deep=True)
+    return int(usage.sum() if hasattr(usage, 'sum') else usage)
+  if hasattr(value, 'nbytes'):
+    size = int(value.nbytes)
+    if getattr(value, 'dtype', None) == object:
+      size += _object_nbytes(value)
+    return size
+  if isinstance(value, dict):
+    return sys.getsizeof(value) + sum(nbytes(k) + nbytes(v) for k, v in value.items())
+  if isinstance(value, (list, tuple)):
+    return sys.getsizeof(value) + sum(nbytes(v) for v in value)
+  return sys.getsizeof(value)
+
+
+class _Flight(object):
+  """
+  a load in progress that concurrent callers of the same key wait for
+  """
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.value = None
+    self.error = None
+
+  def wait(self):
+    self.done.wait()
+    if self.error is not None:
+      raise self.error
+    return self.value
+
+
+class ValueCache(object):
+  """
+  thread safe LRU cache with a byte budget and an optional time to live. Keys are tuples whose first element is the
+  hash of the session the value belongs to. Concurrent loads of the same key are coalesced into a single one
+  """
+
+  def __init__(self, max_bytes, ttl=None, name='values'):
+    self.name = name
+    self.max_bytes = max_bytes
+    self.ttl = ttl
+    self._entries = OrderedDict()
+    self._flights = dict()
+    self._lock = threading.Lock()
+    self._bytes = 0
+    self._hits = 0
+    self._misses = 0
+    self._evictions = 0
+
+  def _remove(self, key):
+    _, size, _ = self._entries.pop(key)
+    self._bytes -= size
+
+  def _lookup(self, key):
+    entry = self._entries.get(key)
+    if entry is None:
+      return None
+    value, _, expires = entry
+    if expires is not None and expires < time.time():
+      self._remove(key)
+      return None
+    return value
+
+  def peek(self, key):
+    """
+    :return: the cached value without affecting the statistics or the LRU order
+    """
+    with self._lock:
+      return self._lookup(key)
+
+  def get(self, key):
+    with self._lock:
+      value = self._lookup(key)
+      if value is None:
+        self._misses += 1
+        metrics.count('cache_misses_total', cache=self.name)
+        return None
+      self._hits += 1
+      metrics.count('cache_hits_total', cache=self.name)
+      # mark as recently used
+      self._entries[key] = self._entries.pop(key)
+      return value
+
+  def put(self, key, value):
+    size = nbytes(value)
+    if size > self.max_bytes:
+      _log.info('not caching %s: %d bytes exceed the cache budget', key, size)
+      return value
+    with self._lock:
+      if key in self._entries:
+        self._remove(key)
+      while self._entries and self._bytes + size > self.max_bytes:
+        self._remove(next(iter(self._entries)))
+        self._evictions += 1
+      self._entries[key] = (value, size, None if self.ttl is None else time.time() + self.ttl)
+      self._bytes += size
+    return value
+
+  def get_or_load(self, key, loader):
+    """
+    returns the cached value or loads it. Only the first caller runs the loader, concurrent callers wait for its
+    result. Errors are raised in all callers and not cached
+    """
+    value = self.get(key)
+    if value is not None:
+      return value
+    with self._lock:
+      value = self._lookup(key)
+      if value is not None:
+        return value
+      flight = self._flights.get(key)
+      leader = flight is None
+      if leader:
+        flight = self._flights[key] = _Flight()
+    if not leader:
+      return flight.wait()
+    try:
+      flight.value = self.put(key, loader())
+      return flight.value
+    except Exception as e:
+      flight.error = e
+      raise
+    finally:
+      with self._lock:
+        del self._flights[key]
+      flight.done.set()
+
+  def invalidate(self, session=None):
+    """
+    removes all entries or the entries of the given session
+    :param session: optional session hash
+    :return: number of removed entries
+    """
+    with self._lock:
+      keys = [k for k in self._entries if session is None or k[0] == session]
+      for k in keys:
+        self._remove(k)
+      return len(keys)
+
+  def stats(self):
+    with self._lock:
+      return dict(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes, hits=self._hits,
+                  misses=self._misses, evictions=self._evictions)
+
+
+_values = None
+_values_lock = threading.Lock()
+
+
+def values():
+  """
+  :return: the process wide cache of fetched dataset values
+  """
+  global _values
+  if _values is None:
+    with _values_lock:
+      if _values is None:
+        c = config.cache or dict()
+        _values = ValueCache(c.get('max_bytes', 1024 * 1024 * 1024), c.get('ttl'))
+  return _values
+
+
+def _write_column(base, values):
+  import json
+  import numpy as np
+  import pandas as pd
+  if isinstance(values, pd.Categorical):
+    codes, categories, kind = values.codes, values.categories, 'categorical'
+  elif isinstance(values, np.ndarray) and values.dtype.kind in 'biufc':
+    with open(base + '.npy', 'wb') as f:
+      np.save(f, values)
+    return dict(kind='numeric')
+  else:
+    values = np.asarray(values)
+    codes, categories = pd.factorize(values.ravel())
+    codes, kind = codes.reshape(values.shape), 'string'
+  with open(base + '.npy', 'wb') as f:
+    np.save(f, codes.astype(np.int32))
+  with open(base + '.json', 'w') as f:
+    json.dump(pd.Index(categories).tolist(), f)
+  return dict(kind=kind)
+
+
+def _read_column(base, desc):
+  import json
+  import numpy as np
+  import pandas as pd
+  values = np.load(base + '.npy', mmap_mode='r')
+  if desc['kind'] == 'numeric':
+    return values
+  with open(base + '.json', 'r') as f:
+    categories = json.load(f)
+  if desc['kind'] == 'categorical':
+    return pd.Categorical.from_codes(np.asarray(values), categories)
+  # code -1 is a missing value
+  lookup = np.empty(len(categories) + 1, dtype=object)
+  lookup[:-1] = categories
+  return lookup[values]
+
+
+class DiskCache(object):
+  """
+  persistent cache of fetched arrays shared by all worker processes. Numeric arrays are stored as .npy files and
+  memory mapped on load, string and categorical arrays as integer codes along with a JSON list of their distinct
+  values. Keys have to change whenever the source data changes. Entries are grouped by the first element of their key,
+  e.g., the session hash, such that the stale ones can be pruned
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+
+  def _path(self, key):
+    import hashlib
+    h = hashlib.sha1(u'\n'.join(u'{k}'.format(k=k) for k in key).encode('utf-8')).hexdigest()
+    return os.path.join(self.directory, u'{k}'.format(k=key[0]), h[:2], h)
+
+  def load(self, key):
+    import json
+    path = self._path(key)
+    if not os.path.isdir(path):
+      return None
+    try:
+      with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+      columns = [_read_column(os.path.join(path, str(i)), c) for i, c in enumerate(meta['columns'])]
+    except (IOError, OSError, ValueError, KeyError):
+      _log.exception('cannot read cache entry %s', path)
+      return None
+    if meta['type'] == 'array':
+      return columns[0]
+    import pandas as pd
+    names = [c['name'] for c in meta['columns']]
+    return pd.DataFrame(OrderedDict(zip(names, columns)), columns=names)
+
+  def store(self, key, value):
+    """
+    :return: whether the entry is stored
+    """
+    import json
+    import shutil
+    import numpy as np
+    import pandas as pd
+    if isinstance(value, pd.DataFrame):
+      meta = dict(type='frame', columns=[dict(name=n) for n in value.columns])
+      columns = [value[n].values for n in value.columns]
+    elif isinstance(value, (np.ndarray, pd.Categorical)):
+      meta = dict(type='array', columns=[dict()])
+      columns = [value]
+    else:
+      return False
+    path = self._path(key)
+    tmp = '{p}.{pid}.{t}.tmp'.format(p=path, pid=os.getpid(), t=threading.current_thread().ident)
+    try:
+      os.makedirs(tmp)
+      for i, (c, values) in enumerate(zip(meta['columns'], columns)):
+        c.update(_write_column(os.path.join(tmp, str(i)), values))
+      with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+      os.rename(tmp, path)
+    except (IOError, OSError, TypeError, ValueError):
+      # also the case if another process stored the same entry in the meantime
+      if not os.path.isdir(path):
+        _log.exception('cannot write cache entry %s', path)
+      shutil.rmtree(tmp, ignore_errors=True)
+    return os.path.isdir(path)
+
+  def remove(self, key):
+    import shutil
+    shutil.rmtree(self._path(key), ignore_errors=True)
+
+  def prune(self, keep):
+    """
+    removes all entries whose key does not start with one of the given values
+    :param keep: set of first key elements to keep
+    :return: number of removed groups
+    """
+    import shutil
+    if not os.path.isdir(self.directory):
+      return 0
+    stale = [name for name in os.listdir(self.directory) if name not in keep]
+    for name in stale:
+      shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+    return len(stale)
+
+  def get_or_load(self, key, loader):
+    value = self.load(key)
+    metrics.count('cache_misses_total' if value is None else 'cache_hits_total', cache='disk')
+    if value is None:
+      value = loader()
+      self.store(key, value)
+    return value
+
+
+_disk = None
+
+
+def disk():
+  """
+  :return: the persistent cache or None if it is disabled
+  """
+  global _disk
+  if _disk is None and config.disk_cache:
+    with _values_lock:
+      if _disk is None:
+        _disk = DiskCache(os.path.join(cache_dir(), 'values'))
+  return _disk
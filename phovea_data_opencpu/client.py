@@ -0,0 +1,149 @@
+###############################################################################
+# Caleydo - Visualization for Molecular Biology - http://caleydo.org
+# Copyright (c) The Caleydo Team. All rights reserved.
+# Licensed under the new BSD license, available at http://caleydo.org/license
+###############################################################################
+
+from logging import getLogger
+import threading
+import time
+import re
+import requests
+import phovea_server
+from . import metrics
+
+__author__ = 'Samuel Gratzl'
+_log = getLogger(__name__)
+_slow_log = getLogger(__name__ + '.slow')
+config = phovea_server.config.view('phovea_data_opencpu')
+
+_session = None
+_session_lock = threading.Lock()
+_pool = None
+_session_path = re.compile(r'^tmp/[^/]+/')
+
+
+def _transport():
+  return config.transport or dict()
+
+
+def to_url(path):
+  return 'http://{host}:{port}/ocpu/{path}'.format(host=config.host, port=config.port, path=path.lstrip('/'))
+
+
+def _create_session():
+  from requests.adapters import HTTPAdapter
+  from requests.packages.urllib3.util.retry import Retry
+  c = _transport()
+  # urllib3 retries idempotent methods only by default, so POST requests evaluating R code are never repeated
+  retry = Retry(total=c.get('retries', 3), backoff_factor=c.get('backoff_factor', 0.5),
+                status_forcelist=(502, 503, 504), raise_on_status=False)
+  adapter = HTTPAdapter(pool_connections=c.get('pool_connections', 4), pool_maxsize=c.get('pool_maxsize', 16),
+                        max_retries=retry)
+  s = requests.Session()
+  s.mount('http://', adapter)
+  s.mount('https://', adapter)
+  return s
+
+
+def session():
+  """
+  :return: the shared keep-alive session used for all requests against OpenCPU
+  """
+  global _session
+  if _session is None:
+    with _session_lock:
+      if _session is None:
+        _session = _create_session()
+  return _session
+
+
+def endpoint(path):
+  """
+  normalizes the given path such that requests against different OpenCPU sessions are counted together
+  :param path:
+  :return:
+  """
+  return _session_path.sub('tmp/{session}/', path.lstrip('/'))
+
+
+def _expression(data):
+  """
+  the R expression of a request for logging purposes
+  """
+  if isinstance(data, dict):
+    return data.get('x') or data.get('expr') or data
+  if isinstance(data, bytes):
+    return data[:4096].decode('utf-8', 'replace')
+  return data
+
+
+def _record(method, label, elapsed, failed):
+  metrics.observe('request_seconds', elapsed, method=method, endpoint=label)
+  if failed:
+    metrics.count('request_errors_total', method=method, endpoint=label)
+
+
+def request(method, path, label=None, **kwargs):
+  """
+  :param label: endpoint the request is recorded under, defaults to the normalized path. Requests of arbitrary paths,
+  e.g., proxied ones, pass a fixed label such that the number of recorded endpoints stays bounded
+  """
+  label = label or endpoint(path)
+  c = _transport()
+  kwargs.setdefault('timeout', (c.get('connect_timeout', 5), c.get('read_timeout', 300)))
+  start = time.time()
+  failed = True
+  try:
+    with metrics.span('request'):
+      r = session().request(method, to_url(path), **kwargs)
+    failed = r.status_code >= 400
+    if not kwargs.get('stream'):
+      metrics.count('transferred_bytes_total', len(r.content), endpoint=label)
+    return r
+  finally:
+    elapsed = time.time() - start
+    _record(method, label, elapsed, failed)
+    if config.slow_request and elapsed >= config.slow_request:
+      _slow_log.warn('slow request %s %s took %.2fs: %s', method, path, elapsed, _expression(kwargs.get('data')))
+
+
+def get(path, **kwargs):
+  return request('GET', path, **kwargs)
+
+
+def post(path, data=None, **kwargs):
+  return request('POST', path, data=data, **kwargs)
+
+
+def _worker_pool():
+  global _pool
+  if _pool is None:
+    from multiprocessing.pool import ThreadPool
+    with _session_lock:
+      if _pool is None:
+        c = _transport()
+        _pool = ThreadPool(c.get('max_concurrency', c.get('pool_maxsize', 16)))
+  return _pool
+
+
+def submit(f, *args, **kwargs):
+  """
+  runs the given function on the bounded pool of I/O workers without blocking the caller
+  :return: AsyncResult, use .get() to wait for the result
+  """
+  return _worker_pool().apply_async(f, args, kwargs)
+
+
+def request_async(method, path, **kwargs):
+  return submit(request, method, path, **kwargs)
+
+
+def gather(calls):
+  """
+  runs the given calls concurrently on the I/O workers, must not be called from within a worker
+  :param calls: list of (function, args) tuples
+  :return: list of results in the same order, the first error is raised
+  """
+  pending = [submit(f, *args) for f, args in calls]
+  return [p.get() for p in pending]
@@ -1,6 +1,8 @@
 from phovea_server.dataset_def import ATable, ADataSetProvider, AColumn, AVector, AMatrix
 from logging import getLogger
-import requests
+from collections import OrderedDict
+from . import cache, client, metrics, offload, rds
+import threading
 import phovea_server
 import numpy as np
 
@@ -9,15 +11,60 @@ _log = getLogger(__name__)
 config = phovea_server.config.view('phovea_data_opencpu')
 
 
-def _to_url(path):
-  return 'http://{host}:{port}/ocpu/{path}'.format(host=config.host, port=config.port, path=path)
-
+class IDMap(object):
+  """
+  local name to id mapping of an idtype. Known names are looked up in a hashed index, only unseen names are sent to
+  the id manager in batches
+  """
 
+  def __init__(self, idtype, manager=None):
+    import pandas as pd
+    self.idtype = idtype
+    self._manager = manager
+    self._lock = threading.Lock()
+    # replaced as a whole such that readers always see a consistent state
+    self._state = (pd.Index([], dtype=object), np.array([], dtype=np.int64))
+
+  def _register(self, names):
+    import pandas as pd
+    import phovea_server.plugin
+    manager = self._manager or phovea_server.plugin.lookup('idmanager')
+    batch_size = config.id_batch or 10000
+    index, ids = self._state
+    for i in range(0, len(names), batch_size):
+      batch = names[i:i + batch_size]
+      batch_ids = np.asarray(manager(list(batch), self.idtype), dtype=np.int64)
+      index = index.append(pd.Index(batch, dtype=object))
+      ids = np.concatenate([ids, batch_ids])
+    self._state = (index, ids)
+
+  def __call__(self, names):
+    import pandas as pd
+    names = pd.Index(np.asarray(names, dtype=object))
+    index, ids = self._state
+    positions = index.get_indexer(names)
+    if (positions < 0).any():
+      with self._lock:
+        index, _ = self._state
+        unseen = pd.unique(names[index.get_indexer(names) < 0])
+        if len(unseen) > 0:
+          self._register(unseen)
+        index, ids = self._state
+        positions = index.get_indexer(names)
+    return ids[positions]
+
+
+_id_maps = dict()
+_id_maps_lock = threading.Lock()
+
+
+@metrics.timed('assign_ids')
 def assign_ids(ids, idtype):
-  import phovea_server.plugin
-
-  manager = phovea_server.plugin.lookup('idmanager')
-  return np.array(manager(ids, idtype))
+  with _id_maps_lock:
+    id_map = _id_maps.get(idtype)
+    if id_map is None:
+      id_map = _id_maps[idtype] = IDMap(idtype)
+  return id_map(ids)
 
 
 def create_session(init_script):
@@ -26,51 +73,58 @@ def create_session(init_script):
   parse(text="
 %s
 
-# generate meta data for phovea
+# generate meta data for phovea, columns of tables are described as parallel vectors
 phoveaDatasets = (function(objs) {
-  known_type = function(col) {
-    clazz <- class(col)
-    if (clazz == 'numeric' || clazz == 'integer' || clazz == 'double' || clazz == 'matrix') {
-      if (typeof(col) == 'integer') {
-        list(type='int', range=c(min(col),max(col)))
-      } else {
-        list(type='real', range=c(min(col),max(col)))
-      }
-    } else if (clazz == 'factor') {
-      list(type='categorical', categories=levels(col))
+  typeOf = function(col) {
+    if (is.factor(col)) {
+      'categorical'
+    } else if (is.integer(col)) {
+      'int'
+    } else if (is.numeric(col)) {
+      'real'
     } else {
-      list(type='string')
+      'string'
     }
   }
-  columnDescription = function(col, colname) {
-    list(name=colname, value=known_type(col))
+  rangeOf = function(col, type) {
+    if (type == 'int' || type == 'real') {
+      suppressWarnings(as.numeric(range(col, na.rm=TRUE)))
+    } else {
+      c(NA_real_, NA_real_)
+    }
+  }
+  valueDescription = function(value) {
+    type = typeOf(value)
+    r = rangeOf(value, type)
+    list(type=type, min=r[1], max=r[2])
   }
   tableDescription = function(dataset, data_name) {
-    columns = mapply(columnDescription, dataset, colnames(dataset), SIMPLIFY='array')
+    types = vapply(dataset, typeOf, '', USE.NAMES=FALSE)
+    ranges = vapply(seq_along(dataset), function(i) rangeOf(dataset[[i]], types[i]), numeric(2))
 
     list(name=data_name,
          size=dim(dataset),
          type='table',
-         columns=columns)
+         columns=list(names=colnames(dataset), types=types, min=ranges[1,], max=ranges[2,]))
   }
   vectorDescription = function(dataset, data_name) {
     list(name=data_name,
          size=length(dataset),
          type='vector',
-         value=known_type(dataset))
+         value=valueDescription(dataset))
   }
   matrixDescription = function(dataset, data_name) {
     list(name=data_name,
          size=dim(dataset),
          type='matrix',
-         value=known_type(dataset))
+         value=valueDescription(dataset))
   }
   r = list()
   for (obj in objs) {
     value = get(obj)
     if (is.data.frame(value)) {
       r[[obj]] = tableDescription(value, obj)
-    } else if (is.vector(value)) {
+    } else if (is.vector(value) || is.factor(value)) {
       r[[obj]] = vectorDescription(value, obj)
     } else if (is.matrix(value)) {
       r[[obj]] = matrixDescription(value, obj)
@@ -81,106 +135,794 @@ phoveaDatasets = (function(objs) {
 ")
 """ % (init_script,)
   _log.debug(code)
-  output = requests.post(_to_url('library/base/R/eval'), dict(expr=code))
+  output = client.post('library/base/R/eval', dict(expr=code))
   _log.debug(output.text)
   session = re.search('/tmp/(.*)/R', output.text).group(1)
   return session
 
 
-def resolve_datasets(session):
-  from itertools import izip
-  # output = requests.get(_to_url('tmp/{s}/console'.format(s=session)))
-  # print(output.text)
+def _scalar(v):
+  # JSON wraps scalars in lists
+  return v[0] if isinstance(v, (list, np.ndarray)) else v
 
-  # use the already computed list of datasets as part of session initializiation
-  output = requests.get(_to_url('tmp/{s}/R/phoveaDatasets/json'.format(s=session)))
-  desc = output.json()
 
-  if not desc:
-    return []
+def _numbers(values):
+  def to_number(v):
+    try:
+      v = float(v)
+    except (TypeError, ValueError):  # NA encoded as string
+      return None
+    return v if np.isfinite(v) else None
 
-  # normalize description and remove single list entries
+  return [to_number(v) for v in values]
 
-  def to_value(value):
-    base = dict(type=value['type'][0])
-    if 'range' in value:
-      base['range'] = value['range']
-    if 'categories' in value:
-      base['categories'] = value['categories']
-    return base
+
+def _to_value(value_type, vmin, vmax):
+  base = dict(type=value_type)
+  if value_type == 'int' or value_type == 'real':
+    cast = int if value_type == 'int' else float
+    base['range'] = [None if vmin is None else cast(vmin), None if vmax is None else cast(vmax)]
+  return base
+
+
+def resolve_datasets(session):
+  """
+  resolves the datasets described by the phoveaDatasets object computed during session initialization. The levels
+  of categorical values are not part of it but loaded on demand
+  :param session: session key
+  :return: list of dataset descriptions
+  """
+  desc = _fetch('GET', 'tmp/{s}/R/phoveaDatasets'.format(s=session))
+
+  if not desc:
+    return []
 
   def to_desc(d):
-    base = dict(name=d['name'][0], type=d['type'][0], size=d['size'])
+    base = dict(name=_scalar(d['name']), type=_scalar(d['type']), size=[int(v) for v in d['size']])
     if base['type'] == 'table':
-      names = d['columns'][0]
-      values = d['columns'][1]
-      base['columns'] = [dict(name=name[0], value=to_value(value)) for name, value in izip(names, values)]
+      c = d['columns']
+      names = list(c['names']) if len(c['names']) else []
+      base['columns'] = [dict(name=name, value=_to_value(t, vmin, vmax))
+                         for name, t, vmin, vmax in zip(names, c['types'], _numbers(c['min']), _numbers(c['max']))]
     if base['type'] == 'matrix' or base['type'] == 'vector':
-      base['value'] = d['value']
+      v = d['value']
+      base['value'] = _to_value(_scalar(v['type']), *_numbers([_scalar(v['min']), _scalar(v['max'])]))
     return base
 
   return [to_desc(d) for d in desc.values()]
 
 
-def _dim_names(session, variable, expected_length, dim):
+def categories(session, requests):
+  """
+  fetches the levels of several categorical vectors and table columns in a single request
+  :param requests: list of (variable, column names) tuples, the column names are None for a vector
+  :return: for each request the list of levels of the vector or a dict of column name to list of levels
+  """
+  def expression(variable, columns):
+    x = '{s}::{v}'.format(s=session, v=variable)
+    if columns is None:
+      return 'levels({x})'.format(x=x)
+    return 'lapply({x}[, c({n}), drop=FALSE], levels)'.format(x=x, n=', '.join(_r_string(c) for c in columns))
+
+  def to_levels(levels, columns):
+    if columns is None:
+      # NULL is encoded as None in rds and as an empty object in json
+      return [] if levels is None or isinstance(levels, dict) else list(levels)
+    return {c: list(levels[c]) for c in columns}
+
+  data = _fetch('POST', 'library/base/R/identity',
+                dict(x='list({e})'.format(e=', '.join(expression(v, c) for v, c in requests))))
+  return [to_levels(levels, columns) for levels, (_, columns) in zip(data, requests)]
+
+
+def _pad_names(data, expected_length, dim):
   import numpy as np
-  output = requests.post(_to_url('library/base/R/{dim}names/json'.format(dim=dim)),
-                         dict(x='{s}::{v}'.format(s=session, v=variable)))
-  data = list(output.json())
-  dim_name = dim.capitalize()
+  data = np.asarray([] if data is None else data, dtype=object)
   if len(data) < expected_length:
     # generate dummy ids
-    for i in range(len(data), expected_length):
-      data.append(dim_name + str(i))
-  return np.array(data)
+    dummy = np.char.add(dim.capitalize(), np.arange(len(data), expected_length).astype(str))
+    data = np.concatenate([data, dummy.astype(object)])
+  return data
+
+
+def dim_names(session, variable, shape):
+  """
+  fetches the row and column names in a single request
+  :param shape: shape of the dataset, a one dimensional shape fetches the row names only
+  :return: list of name arrays, one for each dimension of the shape
+  """
+  import numpy as np
+  data = _fetch('POST', 'library/base/R/dimnames', dict(x='{s}::{v}'.format(s=session, v=variable)))
+  # NULL is encoded as None in rds and as an empty object in json
+  if isinstance(data, dict):
+    data = list(data.values())
+  elif not isinstance(data, list):
+    data = []
+  data = [d if isinstance(d, (list, np.ndarray)) else None for d in data]
+  data += [None] * (len(shape) - len(data))
+  return [_pad_names(d, expected_length, dim) for d, expected_length, dim in zip(data, shape, ('row', 'col'))]
+
+
+class SessionExpired(Exception):
+  """
+  raised if the OpenCPU session referenced by a request no longer exists
+  """
+  pass
 
 
-def row_names(session, variable, expected_length):
-  return _dim_names(session, variable, expected_length, 'row')
+class OpenCPUError(Exception):
+  """
+  raised if OpenCPU answers with an error, e.g., the R error of the evaluated expression
+  """
 
+  def __init__(self, path, status_code, message):
+    super(OpenCPUError, self).__init__(u'{p} failed (status {s}): {m}'.format(p=path, s=status_code, m=message))
+    self.status_code = status_code
 
-def col_names(session, variable, expected_length):
-  return _dim_names(session, variable, expected_length, 'col')
 
+def _raise_for_status(output, path):
+  if not output.ok:
+    raise OpenCPUError(path, output.status_code, output.text.strip())
 
-def column_values(session, variable, column):
-  import numpy as np
-  output = requests.post(_to_url('library/base/R/identity/json'),
-                         dict(x='{s}::{v}${c}'.format(s=session, v=variable, c=column)))
-  data = list(output.json())
-  return np.array(data)
 
+def _format_unavailable(output):
+  """
+  whether OpenCPU rejected the requested output format rather than failed to evaluate the expression
+  """
+  return output.status_code in (404, 406, 415) or (output.status_code == 400 and 'output format' in output.text)
 
-def table_values(session, variable, columns):
+
+def _check_session(output, path):
+  if (output.status_code in (404, 410) and path.startswith('tmp/')) or \
+     (output.status_code == 400 and 'there is no package called' in output.text):
+    raise SessionExpired(path)
+
+
+def _decode(content, fmt, convert=None, args=()):
+  """
+  decodes the payload in the given format and applies convert(data, *args) to the result
+  """
+  import json
+  with metrics.span('decode', format=fmt):
+    if fmt == 'rds':
+      data = rds.loads(content)
+    else:
+      data = json.loads(content.decode('utf-8'), object_pairs_hook=OrderedDict)
+  return data if convert is None else convert(data, *args)
+
+
+def _decode_large(content, fmt, convert, args):
+  if convert is not None and offload.enabled(len(content)):
+    return offload.run(_decode, content, fmt, convert, args)
+  return _decode(content, fmt, convert, args)
+
+
+def _fetch(method, path, data=None, convert=None, args=()):
+  """
+  fetches the R object at the given OpenCPU path using the configured transfer format, JSON is used as fallback if
+  the rds format is not available or cannot be decoded. R errors are raised as OpenCPUError
+  :param method: GET or POST
+  :param path: path without output format
+  :param data: optional POST arguments
+  :param convert: optional picklable function converting the decoded object, large payloads are decoded and converted
+  in the offload worker processes if enabled
+  :param args: additional arguments of convert
+  :return: NumPy/pandas object in case of the binary format else the decoded JSON, the converted one if given
+  """
+  if (config.format or 'rds') == 'rds':
+    output = client.request(method, path + '/rds', data=data)
+    _check_session(output, path)
+    if output.ok:
+      try:
+        return _decode_large(output.content, 'rds', convert, args)
+      except ValueError as e:
+        _log.info('cannot decode %s as rds, falling back to json: %s', path, e)
+    elif _format_unavailable(output):
+      _log.warn('cannot fetch %s as rds (status %s), falling back to json', path, output.status_code)
+    else:
+      _raise_for_status(output, path)
+  output = client.request(method, path + '/json', data=data)
+  _check_session(output, path)
+  _raise_for_status(output, path)
+  return _decode_large(output.content, 'json', convert, args)
+
+
+def _count_decoded(kind, rows, columns):
+  metrics.count('decoded_rows_total', rows, kind=kind)
+  metrics.count('decoded_columns_total', columns, kind=kind)
+
+
+def _typed(values, value_type, categories=None):
+  """
+  converts decoded values to the dtype described by the known_type of the R object
+  :param values: result of _fetch
+  :param value_type: int, real, categorical or string
+  :param categories: the levels of categorical values
+  :return: numpy array or pandas.Categorical
+  """
+  with metrics.span('convert'):
+    values = _to_typed(values, value_type, categories)
+  _count_decoded('array', values.shape[0] if values.ndim else 1, values.shape[1] if values.ndim > 1 else 1)
+  return values
+
+
+def _numeric(values):
+  """
+  converts decoded JSON numbers to float64, missing values encoded as null or as 'NA' strings become NaN
+  """
   import pandas as pd
-  output = requests.get(_to_url('tmp/{s}/R/{v}/json'.format(s=session, v=variable)))
-  data = list(output.json())
-  columns = [c.column for c in columns]
-  return pd.DataFrame.from_records(data, columns=columns)
+  try:
+    return np.array(values, dtype=np.float64)
+  except (TypeError, ValueError):
+    values = np.array(values, dtype=object)
+    return pd.to_numeric(pd.Series(values.ravel()), errors='coerce').values.astype(np.float64).reshape(values.shape)
+
+
+def _compact_strings(values):
+  """
+  object array in which equal strings share a single instance, missing values are None. As in the rds format, R
+  logicals without missing values become a bool array
+  """
+  import pandas as pd
+  values = np.array(values, dtype=object)
+  codes, uniques = pd.factorize(values.ravel())
+  if len(uniques) > 0 and (codes >= 0).all() and all(isinstance(u, (bool, np.bool_)) for u in uniques):
+    return values.astype(bool)
+  # code -1 is a missing value
+  lookup = np.empty(len(uniques) + 1, dtype=object)
+  lookup[:-1] = uniques
+  return lookup[codes].reshape(values.shape)
+
+
+def _to_typed(values, value_type, categories=None):
+  import pandas as pd
+  if isinstance(values, pd.Categorical):
+    if categories is not None and list(values.categories) != list(categories):
+      values = values.set_categories(categories)
+    return values
+  if value_type == 'categorical':
+    # the levels keep the codes and their order in line with the rds format
+    return pd.Categorical(np.asarray(values, dtype=object).ravel(), categories=categories)
+  if not isinstance(values, np.ndarray) or values.dtype == object:
+    if value_type == 'int' or value_type == 'real':
+      values = _numeric(values)
+      if value_type == 'int' and not np.isnan(values).any():
+        values = values.astype(np.int32)
+      return values
+    if value_type is None and not isinstance(values, np.ndarray):
+      values = np.array(list(values))
+    if value_type is not None or values.dtype.kind in 'OSU':
+      return _compact_strings(values)
+    return values
+  if value_type == 'int' and values.dtype.kind == 'i':
+    missing = values == rds.NA_INTEGER
+    if missing.any():
+      values = values.astype(np.float64)
+      values[missing] = np.nan
+      return values
+    # columns of JSON decoded tables are int64
+    return values.astype(np.int32, copy=False)
+  if value_type == 'real':
+    return values.astype(np.float64, copy=False)
+  return values
+
+
+def _asnumpy(values):
+  """
+  categorical values are kept as pandas.Categorical internally and converted to an array of labels for the numpy
+  based dataset api, the labels share the instances of the categories
+  """
+  import pandas as pd
+  if isinstance(values, pd.Categorical):
+    return np.asarray(values, dtype=object)
+  return values
+
+
+def _column_types(columns):
+  """
+  picklable (name, type, categories) description of the given OpenCPUColumns
+  """
+  return [(c.column, c.value, c._desc['value'].get('categories')) for c in columns]
 
 
-def vector_values(session, variable):
+@metrics.timed('convert')
+def _to_frame(data, column_types):
+  import pandas as pd
+  names = [name for name, _, _ in column_types]
+  if not isinstance(data, pd.DataFrame):
+    data = pd.DataFrame.from_records(list(data), columns=names)
+  frame = pd.DataFrame(OrderedDict((name, _to_typed(data[name].values, t, c)) for name, t, c in column_types),
+                       columns=names)
+  _count_decoded('table', len(frame), len(names))
+  return frame
+
+
+def table_columns(session, variable, columns):
+  """
+  fetches several columns of a table in a single request
+  :param columns: list of OpenCPUColumn
+  :return: pandas.DataFrame
+  """
+  names = ', '.join(_r_string(c.column) for c in columns)
+  return _fetch('POST', 'library/base/R/identity',
+                dict(x='{s}::{v}[, c({n}), drop=FALSE]'.format(s=session, v=variable, n=names)),
+                _to_frame, (_column_types(columns),))
+
+
+def table_values(session, variable, columns):
+  return _fetch('GET', 'tmp/{s}/R/{v}'.format(s=session, v=variable), None, _to_frame, (_column_types(columns),))
+
+
+def vector_values(session, variable, value_type=None, categories=None):
+  return _fetch('GET', 'tmp/{s}/R/{v}'.format(s=session, v=variable), None, _typed, (value_type, categories))
+
+
+def matrix_values(session, variable, value_type=None):
+  return vector_values(session, variable, value_type)
+
+
+def range_indices(range, shape):
+  """
+  converts a phovea range to one index array per dimension
+  :param range: phovea range
+  :param shape: shape of the dataset
+  :return: list of index arrays, None for a dimension that is selected as a whole
+  """
   import numpy as np
-  output = requests.get(_to_url('tmp/{s}/R/{v}/json'.format(s=session, v=variable)))
-  data = list(output.json())
-  return np.array(data)
 
+  def to_indices(s, size):
+    if s is None or s is Ellipsis:
+      return None
+    if isinstance(s, slice):
+      start, stop, step = s.indices(size)
+      if start == 0 and stop == size and step == 1:
+        return None
+      return np.arange(start, stop, step)
+    return np.asarray(s, dtype=int)
+
+  return [to_indices(range[i].asslice(), size) for i, size in enumerate(shape)]
+
+
+def selected_fraction(indices, shape):
+  import numpy as np
+  total = float(np.prod(shape))
+  if total == 0:
+    return 1.
+  return np.prod([size if idx is None else len(idx) for idx, size in zip(indices, shape)]) / total
+
+
+def take(values, indices):
+  """
+  applies the result of range_indices to the locally available values
+  """
+  import pandas as pd
+  for axis, idx in enumerate(indices):
+    if idx is None:
+      continue
+    if isinstance(values, pd.DataFrame):
+      values = values.iloc[idx] if axis == 0 else values.iloc[:, idx]
+    elif isinstance(values, pd.Categorical):
+      values = values.take(idx)
+    else:
+      values = values.take(idx, axis=axis)
+  return values
+
+
+def _r_indices(idx):
+  import numpy as np
+  if idx is None:
+    return ''
+  if len(idx) == 0:
+    return 'integer(0)'
+  if len(idx) > 1 and (np.diff(idx) == 1).all():
+    return '{a}:{b}'.format(a=idx[0] + 1, b=idx[-1] + 1)
+  return 'c({i})'.format(i=','.join(str(i + 1) for i in idx))
+
+
+def _r_subset(session, variable, indices, column=None):
+  """
+  R expression selecting the given indices, or the rows of the given column, of a variable
+  """
+  base = '{s}::{v}'.format(s=session, v=variable)
+  if column is not None:
+    return '{b}[{r}, {c}]'.format(b=base, r=_r_indices(indices[0] if indices else None), c=_r_string(column))
+  if not indices or all(idx is None for idx in indices):
+    return base
+  subset = ', '.join(_r_indices(idx) for idx in indices)
+  if len(indices) > 1:
+    subset += ', drop=FALSE'
+  return '{b}[{i}]'.format(b=base, i=subset)
 
-def matrix_values(session, variable):
-  return vector_values(session, variable)
+
+def _subset(session, variable, indices, convert=None, args=()):
+  return _fetch('POST', 'library/base/R/identity', dict(x=_r_subset(session, variable, indices)), convert, args)
+
+
+def _eval(expr):
+  return _fetch('POST', 'library/base/R/identity', dict(x=expr))
+
+
+def _stats_of(d):
+  r = {k: _numbers([_scalar(v)])[0] for k, v in d.items()}
+  r['count'] = int(r['count'] or 0)
+  r['missing'] = int(r['missing'] or 0)
+  return r
+
+
+def stats(session, variable, indices, column=None):
+  """
+  computes min, max, mean, standard deviation, count and number of missing values in R
+  :return: dict of statistics or for tables a dict of column name to statistics of all numeric columns
+  """
+  data = _eval("""local({{
+  f <- function(x) {{
+    x <- as.numeric(x)
+    list(min=suppressWarnings(min(x, na.rm=TRUE)), max=suppressWarnings(max(x, na.rm=TRUE)), mean=mean(x, na.rm=TRUE),
+         sd=sd(x, na.rm=TRUE), count=length(x), missing=sum(is.na(x)))
+  }}
+  d <- {x}
+  if (is.data.frame(d)) lapply(Filter(is.numeric, d), f) else f(d)
+}})""".format(x=_r_subset(session, variable, indices, column)))
+  if not data:  # a table without numeric columns
+    return OrderedDict()
+  if all(isinstance(v, dict) for v in data.values()):
+    return OrderedDict((k, _stats_of(v)) for k, v in data.items())
+  return _stats_of(data)
+
+
+def histogram(session, variable, indices, bins, column=None):
+  """
+  computes a histogram with the given number of equally sized bins in R
+  :return: dict with the bin breaks and counts
+  """
+  data = _eval("""local({{
+  x <- as.numeric(unlist({x}))
+  x <- x[!is.na(x)]
+  r <- if (length(x)) range(x) else c(0, 1)
+  if (r[1] == r[2]) r <- r + c(-0.5, 0.5)
+  h <- hist(x, breaks=seq(r[1], r[2], length.out={b} + 1), plot=FALSE)
+  list(breaks=h$breaks, counts=h$counts)
+}})""".format(x=_r_subset(session, variable, indices, column), b=int(bins)))
+  return dict(breaks=_numbers(data['breaks']), counts=[int(c) for c in data['counts']])
+
+
+def value_counts(session, variable, indices, column=None):
+  """
+  counts the occurrences of the distinct values in R, missing values are counted as None
+  :return: dict with the values and their counts
+  """
+  data = _eval("""local({{
+  t <- table(unlist({x}), useNA='ifany')
+  list(values=names(t), counts=as.integer(t))
+}})""".format(x=_r_subset(session, variable, indices, column)))
+  values = [None if v is None or v == 'NA' else v for v in data['values']]
+  return dict(values=values, counts=[int(c) for c in data['counts']])
+
+
+def table_subset(session, variable, columns, indices):
+  """
+  fetches the selected rows and columns by subsetting on the R side
+  :param indices: result of range_indices
+  """
+  if len(indices) > 1 and indices[1] is not None:
+    columns = [columns[i] for i in indices[1]]
+  return _subset(session, variable, indices, _to_frame, (_column_types(columns),))
+
+
+def vector_subset(session, variable, indices, value_type=None, categories=None):
+  return _subset(session, variable, indices[:1], _typed, (value_type, categories))
+
+
+def matrix_subset(session, variable, indices, value_type=None):
+  values = _subset(session, variable, indices, _typed, (value_type,))
+  if values.ndim < 2:  # JSON encodes an empty matrix as empty list
+    values = values.reshape(tuple(0 if idx is None else len(idx) for idx in indices))
+  return values
+
+
+def _use_subset(values, indices, shape):
+  """
+  whether a range should be fetched by subsetting in R instead of loading and caching the whole object
+  """
+  if values is not None or all(idx is None for idx in indices):
+    return False
+  threshold = config.subset_threshold
+  return selected_fraction(indices, shape) < (0.5 if threshold is None else threshold)
+
+
+def _r_string(s):
+  return "'" + s.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def file_mtimes(files):
+  """
+  the modification times of the given files as seen by the OpenCPU server
+  :param files: list of file paths
+  :return: list of timestamps
+  """
+  if not files:
+    return []
+  output = client.post('library/base/R/identity/json',
+                       dict(x='as.numeric(file.mtime(c({f})))'.format(f=', '.join(_r_string(f) for f in files))))
+  return list(output.json())
 
 
 def discover_sessions(discover):
   import os.path
-  output = requests.post(_to_url('{f}/json'.format(f=discover['function'])), discover['arguments'])
+  output = client.post('{f}/json'.format(f=discover['function']), discover['arguments'])
   data = list(output.json())
   _log.info('discovered: %s', data)
 
-  def to_desc(d):
+  def to_desc(d, mtime):
     name = os.path.splitext(os.path.basename(d))[0]
-    return dict(name=name, script="""load('{s}')""".format(s=d))
+    return dict(name=name, script="""load('{s}')""".format(s=d), file=d, mtime=mtime, discovered=True)
+
+  return [to_desc(d, mtime) for d, mtime in zip(data, file_mtimes(data))]
+
+
+def with_mtimes(descs):
+  """
+  adds the modification time of the file declared by configured sessions, such that their hash changes along with it
+  :param descs: list of session descriptions
+  :return: list of session descriptions
+  """
+  files = [d['file'] for d in descs if d.get('file')]
+  mtimes = dict(zip(files, file_mtimes(files)))
+  return [dict(d, mtime=mtimes[d['file']]) if d.get('file') else d for d in descs]
+
+
+def session_hash(desc):
+  """
+  hash identifying the content of a session, i.e. its init script and the modification time of the loaded file
+  :param desc: session description
+  :return:
+  """
+  import hashlib
+  key = u'{s}\n{m}'.format(s=desc['script'], m=desc.get('mtime'))
+  return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _description_file(desc):
+  import os.path
+  return os.path.join(cache.cache_dir(), 'descriptions', session_hash(desc) + '.json')
+
+
+def load_descriptions(desc):
+  """
+  loads the persisted result of resolve_datasets for the given session description
+  :param desc: session description
+  :return: the list of dataset descriptions or None if not cached
+  """
+  import json
+  import os.path
+  f = _description_file(desc)
+  if not os.path.exists(f):
+    return None
+  try:
+    with open(f, 'r') as fp:
+      return json.load(fp)
+  except ValueError:
+    _log.warn('invalid description cache file %s', f)
+    return None
+
+
+def store_descriptions(desc, entries):
+  import json
+  import os
+  f = _description_file(desc)
+  try:
+    if not os.path.isdir(os.path.dirname(f)):
+      os.makedirs(os.path.dirname(f))
+    tmp = '{f}.{p}.tmp'.format(f=f, p=os.getpid())
+    with open(tmp, 'w') as fp:
+      json.dump(entries, fp)
+    os.rename(tmp, f)
+  except (IOError, OSError):
+    _log.exception('cannot write description cache file %s', f)
+
+
+def _persisted(dataset, artefact, loader):
+  disk = cache.disk()
+  if disk is None:
+    return loader()
+  return disk.get_or_load((dataset._session.hash, dataset._variable, artefact, config.format or 'rds'), loader)
+
+
+def _prune_persisted(hashes):
+  """
+  removes the persisted values of all sessions but the ones of the given hashes
+  """
+  disk = cache.disk()
+  if disk is None:
+    return
+  removed = disk.prune(set(hashes))
+  if removed:
+    _log.info('removed the persisted values of %d outdated sessions', removed)
+
+
+def _cache_key(dataset, artefact):
+  """
+  key of a value in the value cache, the session hash distinguishes sessions of the same name and outdated sessions
+  """
+  return dataset._session.hash, dataset._variable, artefact
+
+
+def _cached(dataset, artefact, loader, persist=True):
+  if persist:
+    return cache.values().get_or_load(_cache_key(dataset, artefact), lambda: _persisted(dataset, artefact, loader))
+  return cache.values().get_or_load(_cache_key(dataset, artefact), loader)
+
+
+def _names(dataset, dim):
+  artefacts = ['rows', 'cols'][:len(dataset.shape)]
+
+  def load():
+    # the names of all dimensions come with the same request, concurrent loads of any dimension share it
+    return _cached(dataset, 'dimnames', lambda: dataset._session.run(dim_names, dataset._variable, dataset.shape),
+                   persist=False)[dim]
+
+  return _cached(dataset, artefacts[dim], load)
+
+
+def _store(dataset, artefact, value):
+  cache.values().put(_cache_key(dataset, artefact), value)
+  disk = cache.disk()
+  if disk is not None:
+    disk.store((dataset._session.hash, dataset._variable, artefact, config.format or 'rds'), value)
+
+
+class _ColumnBatch(object):
+  def __init__(self):
+    self.columns = []
+    self.done = threading.Event()
+    self.values = None
+    self.error = None
+
+
+class ColumnBatcher(object):
+  """
+  coalesces column requests of a table: requests arriving within a short delay are fetched together along with the
+  following not yet loaded columns up to the configured batch size
+  """
+
+  def __init__(self, table):
+    self._table = table
+    self._lock = threading.Lock()
+    self._pending = None
+
+  def _read_ahead(self, columns):
+    limit = config.column_batch or 16
+    all_columns = self._table.columns
+    start = max(all_columns.index(c) for c in columns) + 1
+    for c in all_columns[start:]:
+      if len(columns) >= limit:
+        break
+      if _peek(self._table, 'column/' + c.column) is None:
+        columns.append(c)
+    return columns
+
+  def fetch(self, column):
+    import time
+    with self._lock:
+      batch = self._pending
+      leader = batch is None
+      if leader:
+        batch = self._pending = _ColumnBatch()
+      if column not in batch.columns:
+        batch.columns.append(column)
+
+    if not leader:
+      batch.done.wait()
+    else:
+      delay = config.column_batch_delay
+      time.sleep(0.01 if delay is None else delay)
+      with self._lock:
+        self._pending = None
+        columns = self._read_ahead(list(batch.columns))
+      try:
+        t = self._table
+        t.resolve_categories()
+        batch.values = t._session.run(table_columns, t._variable, columns)
+        for c in columns:
+          if c is not column:
+            _store(t, 'column/' + c.column, batch.values[c.column].values)
+      except Exception as e:
+        batch.error = e
+      finally:
+        batch.done.set()
+
+    if batch.error is not None:
+      raise batch.error
+    return batch.values[column.column].values
+
+
+def _aggregate(dataset, f, range, *args, **kwargs):
+  """
+  computes an aggregation of the dataset or the given range in R, results are cached per dataset
+  """
+  indices = None if range is None else range_indices(range, dataset.shape)
+  artefact = 'aggregate/{f}/{a}/{k}/{s}'.format(f=f.__name__, a='/'.join(str(a) for a in args),
+                                                k=kwargs.get('column'), s=_subset_artefact(indices or []))
+  return _cached(dataset, artefact, lambda: dataset._session.run(f, dataset._variable, indices, *args, **kwargs),
+                 persist=False)
+
+
+def _iter_blocks(dataset, fetch, row_ids, block_size):
+  """
+  yields (row names, row ids, values) blocks of the given dataset, the next block is fetched in the background while
+  the current one is processed
+  :param fetch: function fetching the values of the given indices
+  """
+  n = dataset.shape[0]
+  block_size = block_size or config.block_size or 10000
+  rows = dataset.rows()
+  starts = list(range(0, n, block_size))
+
+  def load(start):
+    indices = [np.arange(start, min(start + block_size, n))] + [None] * (len(dataset.shape) - 1)
+    values = _peek(dataset, 'values')
+    if values is not None:
+      return take(values, indices)
+    return fetch(indices)
+
+  pending = client.submit(load, starts[0]) if starts else None
+  for i, start in enumerate(starts):
+    values = pending.get()
+    pending = client.submit(load, starts[i + 1]) if i + 1 < len(starts) else None
+    end = start + len(values)
+    yield rows[start:end], row_ids[start:end], values
+
+
+def _subset_artefact(indices):
+  import hashlib
+  h = hashlib.sha1()
+  for idx in indices:
+    h.update(b'all' if idx is None else idx.astype('<i8').tobytes())
+    h.update(b'|')
+  return 'subset/' + h.hexdigest()
+
+
+def _peek(dataset, artefact):
+  return cache.values().peek(_cache_key(dataset, artefact))
+
+
+def _describe(dataset, build):
+  """
+  the description of a dataset is static and only computed on first use, a copy is returned such that callers can
+  extend it
+  """
+  if dataset._description is None:
+    dataset._description = build()
+  return dict(dataset._description)
+
 
-  return [to_desc(d) for d in data]
+def _json_default(o):
+  if isinstance(o, np.generic):
+    return o.item()
+  if isinstance(o, np.ndarray):
+    return o.tolist()
+  raise TypeError('{o} is not JSON serializable'.format(o=repr(o)))
+
+
+def description_json(dataset):
+  """
+  :return: the description of the given dataset serialized as JSON bytes
+  """
+  import json
+  if dataset._description_json is None:
+    dataset._description_json = json.dumps(dataset.to_description(), default=_json_default).encode('utf-8')
+  return dataset._description_json
+
+
+def reset_description(dataset):
+  dataset._description = None
+  dataset._description_json = None
+
+
+def _idtypes(dataset):
+  if isinstance(dataset, OpenCPUMatrix):
+    return [dataset.rowtype, dataset.coltype]
+  return [dataset.idtype]
 
 
 class OpenCPUColumn(AColumn):
@@ -188,17 +930,18 @@ class OpenCPUColumn(AColumn):
     super(OpenCPUColumn, self).__init__(desc['name'], desc['value']['type'])
     self._desc = desc
     self.column = desc['name']
+    self.value = desc['value']['type']
     self._table = table
-    self._values = None
 
   def asnumpy(self, range=None):
-    if self._values is None:
-      self._values = self._table.column_values(self.column)
+    values = self._table.column_values(self)
     if range is None:
-      return self._values
-    return self._values[range.asslice()]
+      return _asnumpy(values)
+    return _asnumpy(values[range.asslice()])
 
   def dump(self):
+    if self.value == 'categorical':
+      self._table.resolve_categories()
     return self._desc
 
 
@@ -211,41 +954,91 @@ class OpenCPUTable(ATable):
     self._entry = entry
     self.columns = [OpenCPUColumn(d, self) for d in entry['columns']]
     self.shape = entry['size']
-
-    self._rows = None
-    self._row_ids = None
-    self._values = None
+    self._batcher = ColumnBatcher(self)
+    self._description = None
+    self._description_json = None
 
   def to_description(self):
+    return _describe(self, self._build_description)
+
+  def _build_description(self):
     r = super(OpenCPUTable, self).to_description()
     r['idtype'] = self.idtype
+    self.resolve_categories()
     r['columns'] = [d.dump() for d in self.columns]
     r['size'] = self.shape
     return r
 
+  def resolve_categories(self):
+    """
+    loads the levels of all categorical columns in a single request if not yet done during the bootstrap
+    """
+    resolve_categories(self._session, [self])
+
+  def _categories_request(self):
+    missing = [c.column for c in self.columns if c.value == 'categorical' and 'categories' not in c._desc['value']]
+    return (self._variable, missing) if missing else None
+
+  def _set_categories(self, levels):
+    for c in self.columns:
+      if c.column in levels:
+        c._desc['value']['categories'] = levels[c.column]
+
+  def _typed_columns(self):
+    """
+    the columns with resolved levels, such that categorical values are decoded using them
+    """
+    self.resolve_categories()
+    return self.columns
+
   def column_values(self, column):
-    return column_values(self._session, self._variable, column)
+    values = _peek(self, 'values')
+    if values is not None:
+      # reuse the already loaded table
+      return values[column.column].values
+    return _cached(self, 'column/' + column.column, lambda: self._batcher.fetch(column))
 
   def rows(self, range=None):
-    if self._rows is None:
-      self._rows = row_names(self._session, self._variable, self.shape[0])
+    rows = _names(self, 0)
     if range is None:
-      return self._rows
-    return self._rows[range.asslice()]
+      return rows
+    return rows[range.asslice()]
 
   def rowids(self, range=None):
-    if self._row_ids is None:
-      self._row_ids = assign_ids(self.rows(), self.idtype)
+    row_ids = _cached(self, 'rowids', lambda: assign_ids(self.rows(), self.idtype), persist=False)
     if range is None:
-      return self._row_ids
-    return self._row_ids[range.asslice()]
+      return row_ids
+    return row_ids[range.asslice()]
 
   def aspandas(self, range=None):
-    if self._values is None:
-      self._values = table_values(self._session, self._variable, self.columns)
+    indices = None if range is None else range_indices(range, self.shape)
+    if indices is not None and _use_subset(_peek(self, 'values'), indices, self.shape):
+      # subsets are not persisted, the disk cache would grow with every distinct range
+      return self._session.run(table_subset, self._variable, self._typed_columns(), indices)
+    values = _cached(self, 'values', lambda: self._session.run(table_values, self._variable, self._typed_columns()))
     if range is None:
-      return self._values
-    return self._values.iloc[range.asslice(no_ellipsis=True)]
+      return values
+    return take(values, indices)
+
+  def iter_blocks(self, block_size=None):
+    """
+    iterates over the table in blocks of rows using R side subsetting, such that tables larger than the available
+    memory can be processed
+    :param block_size: number of rows per block
+    :return: generator of (row names, row ids, pandas.DataFrame) tuples
+    """
+    columns = self._typed_columns()
+    return _iter_blocks(self, lambda indices: self._session.run(table_subset, self._variable, columns, indices),
+                        self.rowids(), block_size)
+
+  def stats(self, range=None, column=None):
+    return _aggregate(self, stats, range, column=column)
+
+  def hist(self, bins=10, range=None, column=None):
+    return _aggregate(self, histogram, range, bins, column=column)
+
+  def value_counts(self, range=None, column=None):
+    return _aggregate(self, value_counts, range, column=column)
 
 
 class OpenCPUVector(AVector):
@@ -257,38 +1050,67 @@ class OpenCPUVector(AVector):
     self._entry = entry
     self.value = entry['value']['type']
     self.shape = entry['size']
-
-    self._rows = None
-    self._row_ids = None
-    self._values = None
+    self._description = None
+    self._description_json = None
 
   def to_description(self):
+    return _describe(self, self._build_description)
+
+  def _build_description(self):
     r = super(OpenCPUVector, self).to_description()
     r['idtype'] = self.idtype
+    self.resolve_categories()
     r['value'] = self._entry['value']
     r['size'] = self.shape
     return r
 
+  def resolve_categories(self):
+    resolve_categories(self._session, [self])
+
+  def _categories_request(self):
+    if self.value == 'categorical' and 'categories' not in self._entry['value']:
+      return self._variable, None
+    return None
+
+  def _set_categories(self, levels):
+    self._entry['value']['categories'] = levels
+
+  def _categories(self):
+    if self.value != 'categorical':
+      return None
+    self.resolve_categories()
+    return self._entry['value']['categories']
+
   def rows(self, range=None):
-    if self._rows is None:
-      self._rows = row_names(self._session, self._variable, self.shape[0])
+    rows = _names(self, 0)
     if range is None:
-      return self._rows
-    return self._rows[range.asslice()]
+      return rows
+    return rows[range.asslice()]
 
   def rowids(self, range=None):
-    if self._row_ids is None:
-      self._row_ids = assign_ids(self.rows(), self.idtype)
+    row_ids = _cached(self, 'rowids', lambda: assign_ids(self.rows(), self.idtype), persist=False)
     if range is None:
-      return self._row_ids
-    return self._row_ids[range.asslice()]
+      return row_ids
+    return row_ids[range.asslice()]
 
   def asnumpy(self, range=None):
-    if self._values is None:
-      self._values = vector_values(self._session, self._variable)
+    indices = None if range is None else range_indices(range, self.shape[:1])
+    if indices is not None and _use_subset(_peek(self, 'values'), indices, self.shape[:1]):
+      return _asnumpy(self._session.run(vector_subset, self._variable, indices, self.value, self._categories()))
+    values = _cached(self, 'values', lambda: self._session.run(vector_values, self._variable, self.value,
+                                                               self._categories()))
     if range is None:
-      return self._values
-    return self._values[range[0].asslice()]
+      return _asnumpy(values)
+    return _asnumpy(take(values, indices))
+
+  def stats(self, range=None):
+    return _aggregate(self, stats, range)
+
+  def hist(self, bins=10, range=None):
+    return _aggregate(self, histogram, range, bins)
+
+  def value_counts(self, range=None):
+    return _aggregate(self, value_counts, range)
 
 
 class OpenCPUMatrix(AMatrix):
@@ -301,14 +1123,13 @@ class OpenCPUMatrix(AMatrix):
     self._entry = entry
     self.value = entry['value']['type']
     self.shape = entry['size']
-
-    self._rows = None
-    self._row_ids = None
-    self._cols = None
-    self._col_ids = None
-    self._values = None
+    self._description = None
+    self._description_json = None
 
   def to_description(self):
+    return _describe(self, self._build_description)
+
+  def _build_description(self):
     r = super(OpenCPUMatrix, self).to_description()
     r['rowtype'] = self.rowtype
     r['coltype'] = self.coltype
@@ -317,66 +1138,298 @@ class OpenCPUMatrix(AMatrix):
     return r
 
   def rows(self, range=None):
-    if self._rows is None:
-      self._rows = row_names(self._session, self._variable, self.shape[0])
+    rows = _names(self, 0)
     if range is None:
-      return self._rows
-    return self._rows[range.asslice()]
+      return rows
+    return rows[range.asslice()]
 
   def rowids(self, range=None):
-    if self._row_ids is None:
-      self._row_ids = assign_ids(self.rows(), self.rowtype)
+    row_ids = _cached(self, 'rowids', lambda: assign_ids(self.rows(), self.rowtype), persist=False)
     if range is None:
-      return self._row_ids
-    return self._row_ids[range.asslice()]
+      return row_ids
+    return row_ids[range.asslice()]
 
   def cols(self, range=None):
-    if self._cols is None:
-      self._cols = col_names(self._session, self._variable, self.shape[0])
+    cols = _names(self, 1)
     if range is None:
-      return self._cols
-    return self._cols[range.asslice()]
+      return cols
+    return cols[range.asslice()]
 
   def colids(self, range=None):
-    if self._row_ids is None:
-      self._row_ids = assign_ids(self.rows(), self.coltype)
+    col_ids = _cached(self, 'colids', lambda: assign_ids(self.cols(), self.coltype), persist=False)
     if range is None:
-      return self._row_ids
-    return self._row_ids[range.asslice()]
+      return col_ids
+    return col_ids[range.asslice()]
 
   def asnumpy(self, range=None):
-    if self._values is None:
-      self._values = matrix_values(self._session, self._variable)
+    indices = None if range is None else range_indices(range, self.shape)
+    if indices is not None and _use_subset(_peek(self, 'values'), indices, self.shape):
+      return self._session.run(matrix_subset, self._variable, indices, self.value)
+    values = _cached(self, 'values', lambda: self._session.run(matrix_values, self._variable, self.value))
     if range is None:
-      return self._values
-    return self._values[range[0].asslice()]
+      return values
+    return take(values, indices)
+
+  def iter_blocks(self, block_size=None):
+    """
+    iterates over the matrix in blocks of rows using R side subsetting, such that matrices larger than the available
+    memory can be processed
+    :param block_size: number of rows per block
+    :return: generator of (row names, row ids, numpy array) tuples
+    """
+    return _iter_blocks(self, lambda indices: self._session.run(matrix_subset, self._variable, indices, self.value),
+                        self.rowids(), block_size)
+
+  def stats(self, range=None):
+    return _aggregate(self, stats, range)
+
+  def hist(self, bins=10, range=None):
+    return _aggregate(self, histogram, range, bins)
+
+  def value_counts(self, range=None):
+    return _aggregate(self, value_counts, range)
+
+
+def resolve_categories(session, datasets):
+  """
+  loads the missing levels of the categorical vectors and table columns of the given datasets in a single request
+  :param session: the OpenCPUSession of the datasets
+  :param datasets: list of datasets
+  """
+  pending = [(d, d._categories_request()) for d in datasets if hasattr(d, '_categories_request')]
+  pending = [(d, r) for d, r in pending if r is not None]
+  if not pending:
+    return
+  levels = session.run(categories, [r for _, r in pending])
+  for (d, _), l in zip(pending, levels):
+    d._set_categories(l)
 
 
 class OpenCPUSession(object):
-  def __init__(self, desc):
+  def __init__(self, desc, lazy=False):
     self._desc = desc
-    self._session = create_session(desc['script'])
+    self.name = desc['name']
+    self.hash = session_hash(desc)
+    self._key = None
+    self._lock = threading.Lock()
+    self.last_used = 0
 
     session_name = desc['name']
-    entries = resolve_datasets(self._session)
+    entries = load_descriptions(desc) if lazy else None
+    store = lazy and entries is None
+    if entries is None:
+      entries = resolve_datasets(self.key)
     meta = desc.get('meta', dict())
 
     def to_dataset(entry):
       meta_data = meta.get(entry['name'], dict())
       if entry['type'] == 'table':
-        return OpenCPUTable(entry, self._session, meta_data, session_name)
+        return OpenCPUTable(entry, self, meta_data, session_name)
       elif entry['type'] == 'vector':
-        return OpenCPUVector(entry, self._session, meta_data, session_name)
+        return OpenCPUVector(entry, self, meta_data, session_name)
       elif entry['type'] == 'matrix':
-        return OpenCPUMatrix(entry, self._session, meta_data, session_name)
+        return OpenCPUMatrix(entry, self, meta_data, session_name)
       return None
 
     self._entries = [v for v in (to_dataset(entry) for entry in entries) if v is not None]
 
+    if not lazy or store:
+      # the levels of all datasets in one request during the concurrent bootstrap, listing does not need R anymore
+      resolve_categories(self, self._entries)
+    if store:
+      # persist complete descriptions such that listing them later does not require the R session
+      store_descriptions(desc, entries)
+
+  @property
+  def key(self):
+    """
+    the OpenCPU session key, the session is created on first access
+    """
+    import time
+    self.last_used = time.time()
+    if self._key is None:
+      with self._lock:
+        if self._key is None:
+          self._key = create_session(self._desc['script'])
+          _keep_alive(self)
+    return self._key
+
+  def expire(self, key):
+    """
+    marks the given session key as expired such that the session is recreated on next access, the key is compared
+    to deduplicate concurrent expirations
+    """
+    with self._lock:
+      if self._key == key:
+        _log.info('session %s (%s) expired', self.name, key)
+        self._key = None
+        for e in self._entries:
+          reset_description(e)
+
+  def run(self, f, *args, **kwargs):
+    """
+    calls f with the session key and the given arguments, the session is transparently recreated and the call
+    retried if OpenCPU no longer knows it
+    """
+    key = self.key
+    try:
+      return f(key, *args, **kwargs)
+    except SessionExpired:
+      self.expire(key)
+      return f(self.key, *args, **kwargs)
+
+  def ping(self):
+    """
+    touches the OpenCPU session to prevent its garbage collection
+    :return: False if the session has already expired
+    """
+    key = self._key
+    if key is None:
+      return True
+    output = client.get('tmp/{s}/'.format(s=key))
+    if output.status_code in (404, 410):
+      self.expire(key)
+      return False
+    return True
+
   def __iter__(self):
     return iter(self._entries)
 
 
+_alive_sessions = None
+_keep_alive_lock = threading.Lock()
+
+
+def _keep_alive(session):
+  """
+  registers a session for periodic keep alive touches while it is used
+  """
+  import weakref
+  global _alive_sessions
+  if not config.keepalive_interval:
+    return
+  with _keep_alive_lock:
+    if _alive_sessions is None:
+      _alive_sessions = weakref.WeakSet()
+      _schedule_keep_alive()
+    _alive_sessions.add(session)
+
+
+def _schedule_keep_alive():
+  timer = threading.Timer(config.keepalive_interval, _touch_sessions)
+  timer.daemon = True
+  timer.start()
+
+
+def _touch_sessions():
+  import time
+  try:
+    threshold = time.time() - (config.keepalive_idle or 3600)
+    with _keep_alive_lock:
+      sessions = [s for s in _alive_sessions if s.last_used >= threshold]
+    for s in sessions:
+      s.ping()
+  except Exception:
+    _log.exception('keeping sessions alive failed')
+  finally:
+    _schedule_keep_alive()
+
+
+def _create_session_safe(desc):
+  import time
+  start = time.time()
+  try:
+    session = OpenCPUSession(desc, lazy=bool(config.lazy))
+  except Exception:
+    _log.exception('cannot create session %s, skipping it', desc['name'])
+    return None
+  _log.info('created session %s in %.2fs', desc['name'], time.time() - start)
+  return session
+
+
+def _load(dataset):
+  if isinstance(dataset, OpenCPUTable):
+    dataset.aspandas()
+  else:
+    dataset.asnumpy()
+  dataset.rows()
+  return dataset
+
+
+def prefetch(datasets):
+  """
+  loads the values and row names of the given datasets concurrently using the bounded pool of I/O workers
+  :param datasets: list of OpenCPU datasets
+  :return: the datasets
+  """
+  return client.gather([(_load, (d,)) for d in datasets])
+
+
+def create_sessions(descs):
+  """
+  bootstraps the given sessions concurrently using a bounded pool of worker threads, sessions whose script fails
+  are skipped
+  :param descs: list of session descriptions
+  :return: list of OpenCPUSession
+  """
+  from multiprocessing.pool import ThreadPool
+  if not descs:
+    return []
+  pool = ThreadPool(max(1, min(config.bootstrap_workers or 4, len(descs))))
+  try:
+    sessions = pool.map(_create_session_safe, descs)
+  finally:
+    pool.close()
+    pool.join()
+  return [s for s in sessions if s is not None]
+
+
+class _DatasetIndex(object):
+  """
+  immutable lookup structures of the datasets of a list of sessions
+  """
+
+  def __init__(self, sessions):
+    self.sessions = sessions
+    self.by_id = dict()
+    self.by_session = OrderedDict()
+    self.by_type = dict()
+    self.by_idtype = dict()
+    for session in sessions:
+      entries = list(session)
+      self.by_session[session.name] = entries
+      for entry in entries:
+        self.by_id[entry.id] = entry
+        self.by_type.setdefault(entry.type, []).append(entry)
+        for idtype in set(_idtypes(entry)):
+          self.by_idtype.setdefault(idtype, []).append(entry)
+    self.size = sum(len(e) for e in self.by_session.values())
+
+  def select(self, dataset_type=None, session_name=None, idtype=None):
+    """
+    the datasets matching all given criteria, starting from the smallest of the matching lookups
+    """
+    candidates = []
+    if dataset_type is not None:
+      candidates.append(self.by_type.get(dataset_type, []))
+    if session_name is not None:
+      candidates.append(self.by_session.get(session_name, []))
+    if idtype is not None:
+      candidates.append(self.by_idtype.get(idtype, []))
+    if not candidates:
+      import itertools
+      return list(itertools.chain(*self.by_session.values()))
+
+    def matches(e):
+      if dataset_type is not None and e.type != dataset_type:
+        return False
+      if session_name is not None and e._session.name != session_name:
+        return False
+      return idtype is None or idtype in _idtypes(e)
+
+    return [e for e in min(candidates, key=len) if matches(e)]
+
+
 class OpenCPUProvider(ADataSetProvider):
   """
   dataset provider for Caleydo from Calumma REST Api. It uses cached for common categorical properties and the
@@ -385,21 +1438,138 @@ class OpenCPUProvider(ADataSetProvider):
 
   def __init__(self):
     self.c = config
-    self._sessions = [OpenCPUSession(desc) for desc in config.sessions]
-
-    if config.discover:
-      self._sessions.extend([OpenCPUSession(desc) for desc in discover_sessions(config.discover)])
+    descs = with_mtimes(list(config.sessions or []))
+    discovered = discover_sessions(config.discover) if config.discover else []
+
+    sessions = create_sessions(descs + discovered)
+    self._static = [s for s in sessions if not s._desc.get('discovered')]
+    self._discovered = OrderedDict((s._desc['file'], s) for s in sessions if s._desc.get('discovered'))
+    self._index = _DatasetIndex(self._static + list(self._discovered.values()))
+    self._rediscover_lock = threading.Lock()
+    # also the ones of sessions that failed to start
+    self._static_hashes = set(session_hash(d) for d in descs)
+    _prune_persisted(self._static_hashes | set(session_hash(d) for d in discovered))
+
+    if config.discover and config.rediscover_interval:
+      self._schedule_rediscover()
+
+  def _schedule_rediscover(self):
+    timer = threading.Timer(config.rediscover_interval, self._periodic_rediscover)
+    timer.daemon = True
+    timer.start()
+
+  def _periodic_rediscover(self):
+    try:
+      self.rediscover()
+    except Exception:
+      _log.exception('rediscovering sessions failed')
+    finally:
+      self._schedule_rediscover()
+
+  def rediscover(self):
+    """
+    rescans the discovered files and creates sessions for new or changed files only, sessions of removed files are
+    retired. The list of sessions is replaced at once such that lookups are served during the rescan
+    :return: dict with the added, updated and removed files
+    """
+    if not config.discover:
+      return dict(added=[], updated=[], removed=[])
+    with self._rediscover_lock:
+      current = self._discovered
+      descs = discover_sessions(config.discover)
+      changed = [d for d in descs if d['file'] not in current or current[d['file']].hash != session_hash(d)]
+      created = OrderedDict((s._desc['file'], s) for s in create_sessions(changed))
+      found = set(d['file'] for d in descs)
+
+      discovered = OrderedDict()
+      for d in descs:
+        f = d['file']
+        if f in created:
+          discovered[f] = created[f]
+        elif f in current:  # unchanged or failed to recreate
+          discovered[f] = current[f]
+      self._discovered = discovered
+      self._index = _DatasetIndex(self._static + list(discovered.values()))
+
+      retired = [current[f] for f in current if f not in found or f in created]
+      live = set(s.hash for s in self._index.sessions)
+      for session in retired:
+        if session.hash not in live:
+          cache.values().invalidate(session.hash)
+      _prune_persisted(live | self._static_hashes | set(session_hash(d) for d in descs))
+
+      r = dict(added=[f for f in created if f not in current], updated=[f for f in created if f in current],
+               removed=[f for f in current if f not in found])
+      _log.info('rediscovered sessions: %s', r)
+      return r
 
   def __len__(self):
-    return len(self.entries)
+    return self._index.size
 
   def __iter__(self):
     import itertools
-    return itertools.chain(*self._sessions)
+    return itertools.chain(*self._index.sessions)
 
   def __getitem__(self, dataset_id):
-    return next((e for e in self if e.id == dataset_id))
+    return self._index.by_id.get(dataset_id)
+
+  def by_session(self, session_name):
+    return list(self._index.by_session.get(session_name, []))
+
+  def by_type(self, dataset_type):
+    return list(self._index.by_type.get(dataset_type, []))
+
+  def by_idtype(self, idtype):
+    return list(self._index.by_idtype.get(idtype, []))
+
+  def descriptions(self, dataset_type=None, session_name=None, idtype=None):
+    """
+    the cached descriptions of the datasets matching all given criteria
+    """
+    return [e.to_description() for e in self._index.select(dataset_type, session_name, idtype)]
+
+  def descriptions_json(self, dataset_type=None, session_name=None, idtype=None):
+    """
+    like descriptions but as JSON array assembled from the pre-serialized descriptions
+    :return: bytes
+    """
+    entries = self._index.select(dataset_type, session_name, idtype)
+    return b'[' + b','.join(description_json(e) for e in entries) + b']'
+
+  def invalidate(self, session_name=None):
+    """
+    removes the cached values of all sessions or of the sessions with the given name
+    :return: number of removed entries
+    """
+    if session_name is None:
+      return cache.values().invalidate()
+    hashes = set(s.hash for s in self._index.sessions if s.name == session_name)
+    return sum(cache.values().invalidate(h) for h in hashes)
+
+  def prefetch(self, dataset_ids):
+    """
+    loads the given datasets concurrently, unknown ids are skipped
+    :return: the loaded datasets
+    """
+    dataset_ids = list(dataset_ids)
+    datasets = [self[i] for i in dataset_ids]
+    unknown = [i for i, d in zip(dataset_ids, datasets) if d is None]
+    if unknown:
+      _log.warn('skipping prefetch of unknown datasets: %s', unknown)
+    return prefetch([d for d in datasets if d is not None])
+
+
+_provider = None
+
+
+def provider():
+  """
+  :return: the created provider instance or None
+  """
+  return _provider
 
 
 def create():
-  return OpenCPUProvider()
+  global _provider
+  _provider = OpenCPUProvider()
+  return _provider
@@ -0,0 +1,176 @@
+###############################################################################
+# Caleydo - Visualization for Molecular Biology - http://caleydo.org
+# Copyright (c) The Caleydo Team. All rights reserved.
+# Licensed under the new BSD license, available at http://caleydo.org/license
+###############################################################################
+"""
+process wide timing histograms and counters of the provider stages, rendered in the Prometheus text format
+"""
+
+from contextlib import contextmanager
+import threading
+import time
+
+__author__ = 'Samuel Gratzl'
+
+PREFIX = 'phovea_opencpu_'
+# upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+
+_lock = threading.Lock()
+_histograms = dict()
+_counters = dict()
+_help = dict(stage_seconds='duration of the provider stages: request (R evaluation and transfer), decode, convert '
+                           '(typed arrays and data frames), assign_ids and proxy (time to the first byte of proxied '
+                           'requests)',
+             request_seconds='duration of the requests against OpenCPU by endpoint, proxied and batched requests are '
+                             'grouped as proxy and batch',
+             request_errors_total='failed requests against OpenCPU by endpoint, i.e., errors and 4xx or 5xx responses',
+             transferred_bytes_total='bytes received from OpenCPU by endpoint',
+             decoded_rows_total='number of rows decoded by kind of value',
+             decoded_columns_total='number of columns decoded by kind of value',
+             cache_hits_total='cache hits by cache',
+             cache_misses_total='cache misses by cache',
+             proxy_bytes_total='bytes streamed by the proxy')
+
+
+def _key(labels):
+  return tuple(sorted(labels.items()))
+
+
+class _Histogram(object):
+  def __init__(self):
+    self.counts = [0] * len(BUCKETS)
+    self.count = 0
+    self.sum = 0.
+
+  def observe(self, value):
+    for i, bound in enumerate(BUCKETS):
+      if value <= bound:
+        self.counts[i] += 1
+    self.count += 1
+    self.sum += value
+
+
+def observe(name, value, **labels):
+  """
+  records a value in the histogram of the given name and labels
+  """
+  with _lock:
+    series = _histograms.setdefault(name, dict())
+    h = series.get(_key(labels))
+    if h is None:
+      h = series[_key(labels)] = _Histogram()
+    h.observe(value)
+
+
+def count(name, value=1, **labels):
+  """
+  increments the counter of the given name and labels
+  """
+  with _lock:
+    series = _counters.setdefault(name, dict())
+    k = _key(labels)
+    series[k] = series.get(k, 0) + value
+
+
+@contextmanager
+def span(stage, **labels):
+  """
+  times the enclosed block as the given stage
+  """
+  start = time.time()
+  try:
+    yield
+  finally:
+    observe('stage_seconds', time.time() - start, stage=stage, **labels)
+
+
+def timed(stage):
+  """
+  decorator timing each call of the function as the given stage
+  """
+  def decorator(f):
+    from functools import wraps
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+      with span(stage):
+        return f(*args, **kwargs)
+
+    return wrapper
+
+  return decorator
+
+
+def drain():
+  """
+  removes and returns all recorded metrics, such that a worker process can hand them to the serving process
+  :return: (histograms, counters) to be passed to merge
+  """
+  global _histograms, _counters
+  with _lock:
+    recorded = _histograms, _counters
+    _histograms, _counters = dict(), dict()
+  return recorded
+
+
+def merge(recorded):
+  """
+  adds the metrics recorded in another process
+  :param recorded: result of drain
+  """
+  histograms, counters = recorded
+  with _lock:
+    for name, series in histograms.items():
+      target = _histograms.setdefault(name, dict())
+      for k, h in series.items():
+        t = target.get(k)
+        if t is None:
+          target[k] = h
+          continue
+        t.counts = [a + b for a, b in zip(t.counts, h.counts)]
+        t.count += h.count
+        t.sum += h.sum
+    for name, series in counters.items():
+      target = _counters.setdefault(name, dict())
+      for k, c in series.items():
+        target[k] = target.get(k, 0) + c
+
+
+def _escape(v):
+  return u'{v}'.format(v=v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(key, extra=()):
+  items = list(key) + list(extra)
+  if not items:
+    return ''
+  return '{' + ','.join(u'{k}="{v}"'.format(k=k, v=_escape(v)) for k, v in items) + '}'
+
+
+def _header(lines, name, kind):
+  if name in _help:
+    lines.append(u'# HELP {p}{n} {h}'.format(p=PREFIX, n=name, h=_help[name]))
+  lines.append(u'# TYPE {p}{n} {k}'.format(p=PREFIX, n=name, k=kind))
+
+
+def render():
+  """
+  :return: all metrics in the Prometheus text exposition format
+  """
+  lines = []
+  with _lock:
+    for name in sorted(_histograms):
+      _header(lines, name, 'histogram')
+      for key, h in sorted(_histograms[name].items()):
+        for bound, c in zip(BUCKETS, h.counts):
+          lines.append(u'{p}{n}_bucket{l} {c}'.format(p=PREFIX, n=name, l=_labels(key, [('le', bound)]), c=c))
+        lines.append(u'{p}{n}_bucket{l} {c}'.format(p=PREFIX, n=name, l=_labels(key, [('le', '+Inf')]), c=h.count))
+        lines.append(u'{p}{n}_sum{l} {s}'.format(p=PREFIX, n=name, l=_labels(key), s=repr(h.sum)))
+        lines.append(u'{p}{n}_count{l} {c}'.format(p=PREFIX, n=name, l=_labels(key), c=h.count))
+    for name in sorted(_counters):
+      _header(lines, name, 'counter')
+      for key, c in sorted(_counters[name].items()):
+        lines.append(u'{p}{n}{l} {c}'.format(p=PREFIX, n=name, l=_labels(key), c=c))
+  return u'\n'.join(lines) + u'\n'
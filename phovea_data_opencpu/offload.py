@@ -0,0 +1,109 @@
+###############################################################################
+# Caleydo - Visualization for Molecular Biology - http://caleydo.org
+# Copyright (c) The Caleydo Team. All rights reserved.
+# Licensed under the new BSD license, available at http://caleydo.org/license
+###############################################################################
+"""
+optional pool of worker processes decoding large payloads outside of the serving process, such that the decoding
+does not hold its GIL. Results are handed back as memory mapped files in a shared memory directory instead of being
+pickled
+"""
+
+from logging import getLogger
+import os
+import threading
+import uuid
+import phovea_server
+from . import cache, metrics
+
+__author__ = 'Samuel Gratzl'
+_log = getLogger(__name__)
+config = phovea_server.config.view('phovea_data_opencpu')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _config():
+  return config.offload or dict()
+
+
+def _context():
+  import multiprocessing
+  if not hasattr(multiprocessing, 'get_context'):  # python 2
+    return multiprocessing
+  # do not fork the multi threaded server process
+  methods = multiprocessing.get_all_start_methods()
+  return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def pool():
+  """
+  :return: the pool of decoding processes or None if it is disabled
+  """
+  global _pool
+  workers = _config().get('workers', 0)
+  if not workers:
+    return None
+  if _pool is None:
+    with _pool_lock:
+      if _pool is None:
+        _log.info('starting %d decoding processes', workers)
+        _pool = _context().Pool(workers)
+  return _pool
+
+
+def enabled(size):
+  """
+  whether a payload of the given number of bytes should be decoded in the worker processes
+  """
+  return size >= _config().get('threshold', 16 * 1024 * 1024) and pool() is not None
+
+
+def shared_dir():
+  """
+  :return: directory through which the results are handed back, a memory backed one if available
+  """
+  c = _config()
+  if c.get('directory'):
+    return c['directory']
+  if os.path.isdir('/dev/shm'):
+    return os.path.join('/dev/shm', 'phovea_data_opencpu')
+  return os.path.join(cache.cache_dir(), 'shared')
+
+
+def _call(directory, f, args):
+  """
+  runs in the worker process: arrays and data frames are stored in the shared directory and only their key is
+  returned along with the metrics recorded during the call
+  """
+  metrics.drain()
+  value = f(*args)
+  recorded = metrics.drain()
+  key = ('offload', uuid.uuid4().hex)
+  if cache.DiskCache(directory).store(key, value):
+    return key, None, recorded
+  return None, value, recorded
+
+
+def run(f, *args):
+  """
+  calls f with the given arguments in one of the worker processes and waits for its result, f and the arguments
+  have to be picklable
+  """
+  directory = shared_dir()
+  with metrics.span('offload'):
+    key, value, recorded = pool().apply(_call, (directory, f, args))
+    if key is not None:
+      shared = cache.DiskCache(directory)
+      try:
+        # numeric arrays stay valid after their files are removed as they are memory mapped
+        value = shared.load(key)
+      finally:
+        shared.remove(key)
+  if value is None:
+    _log.warn('cannot load the shared result of %s, decoding it inline', f.__name__)
+    return f(*args)
+  # the decode and convert stages ran in the worker
+  metrics.merge(recorded)
+  return value
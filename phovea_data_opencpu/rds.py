@@ -0,0 +1,357 @@
+###############################################################################
+# Caleydo - Visualization for Molecular Biology - http://caleydo.org
+# Copyright (c) The Caleydo Team. All rights reserved.
+# Licensed under the new BSD license, available at http://caleydo.org/license
+###############################################################################
+"""
+minimal reader for R's serialization format (XDR) as returned by the OpenCPU /rds output format. It supports the
+subset needed for data transfer: atomic vectors, lists, factors, matrices and data frames. Numeric vectors are decoded
+directly from the payload buffer without intermediate Python objects.
+"""
+
+import struct
+import zlib
+import numpy as np
+
+__author__ = 'Samuel Gratzl'
+
+NA_INTEGER = -2147483648
+# lower word of R's NA_real_, a NaN
+_NA_REAL_PAYLOAD = 1954
+
+# SEXP types
+_NILSXP = 0
+_SYMSXP = 1
+_LISTSXP = 2
+_CLOSXP = 3
+_ENVSXP = 4
+_PROMSXP = 5
+_LANGSXP = 6
+_CHARSXP = 9
+_LGLSXP = 10
+_INTSXP = 13
+_REALSXP = 14
+_CPLXSXP = 15
+_STRSXP = 16
+_DOTSXP = 17
+_VECSXP = 19
+_EXPRSXP = 20
+_RAWSXP = 24
+
+# serialization pseudo types
+_REFSXP = 255
+_NILVALUE_SXP = 254
+_GLOBALENV_SXP = 253
+_UNBOUNDVALUE_SXP = 252
+_MISSINGARG_SXP = 251
+_BASENAMESPACE_SXP = 250
+_EMPTYENV_SXP = 242
+_BASEENV_SXP = 241
+_ATTRLANGSXP = 240
+_ATTRLISTSXP = 239
+_ALTREP_SXP = 238
+
+_ENVIRONMENT_MARKERS = (_GLOBALENV_SXP, _UNBOUNDVALUE_SXP, _MISSINGARG_SXP, _BASENAMESPACE_SXP, _EMPTYENV_SXP,
+                        _BASEENV_SXP)
+_PAIRLIST_TYPES = (_LISTSXP, _LANGSXP, _CLOSXP, _PROMSXP, _DOTSXP, _ATTRLANGSXP, _ATTRLISTSXP)
+
+# errors raised by truncated or otherwise malformed payloads, reported as UnsupportedError
+_MALFORMED = (struct.error, zlib.error, ValueError, IndexError, KeyError, AttributeError, TypeError)
+
+_UTF8_MASK = 1 << 3
+_LATIN1_MASK = 1 << 2
+
+
+class UnsupportedError(ValueError):
+  """
+  raised if the payload uses a feature of the serialization format that is not supported by this reader
+  """
+  pass
+
+
+class RObject(object):
+  """
+  a decoded R object along with its attributes
+  """
+
+  def __init__(self, sexptype, value, attributes=None):
+    self.sexptype = sexptype
+    self.value = value
+    self.attributes = attributes or dict()
+
+  def attr(self, name, default=None):
+    a = self.attributes.get(name)
+    return default if a is None else a.value
+
+  @property
+  def classes(self):
+    c = self.attr('class')
+    return [] if c is None else list(c)
+
+
+class _Symbol(object):
+  def __init__(self, name):
+    self.name = name
+
+
+def _pairlist_to_dict(node):
+  r = dict()
+  while isinstance(node, RObject) and node.sexptype in _PAIRLIST_TYPES:
+    tag, car, cdr = node.value
+    r[tag.name if isinstance(tag, _Symbol) else tag] = car
+    node = cdr
+  return r
+
+
+def decompress(data):
+  if data[:2] == b'\x1f\x8b':
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+  if data[:3] == b'BZh':
+    import bz2
+    return bz2.decompress(data)
+  if data[:5] == b'\xfd7zXZ':
+    try:
+      import lzma
+    except ImportError:
+      raise UnsupportedError('xz compressed payloads are not supported')
+    return lzma.decompress(data)
+  return data
+
+
+class _Reader(object):
+  def __init__(self, data):
+    self._data = data
+    self._pos = 0
+    self._refs = []
+
+  def _int(self):
+    v = struct.unpack_from('>i', self._data, self._pos)[0]
+    self._pos += 4
+    return v
+
+  def _bytes(self, n):
+    v = self._data[self._pos:self._pos + n]
+    self._pos += n
+    return v
+
+  def _array(self, dtype, n, itemsize):
+    v = np.frombuffer(self._data, dtype=dtype, count=n, offset=self._pos)
+    self._pos += n * itemsize
+    return v
+
+  def _length(self):
+    n = self._int()
+    if n == -1:
+      upper = self._int()
+      lower = self._int()
+      n = (upper << 32) + lower
+    return n
+
+  def header(self):
+    fmt = self._bytes(2)
+    if fmt != b'X\n':
+      raise UnsupportedError('only the XDR serialization format is supported')
+    version = self._int()
+    self._int()  # writer version
+    self._int()  # min reader version
+    if version == 3:
+      self._bytes(self._int())  # native encoding
+    elif version != 2:
+      raise UnsupportedError('unsupported serialization version: {v}'.format(v=version))
+
+  def _attributes(self):
+    return _pairlist_to_dict(self.item())
+
+  def _charsxp(self, levels):
+    n = self._int()
+    if n == -1:
+      return None
+    raw = self._bytes(n)
+    return raw.decode('latin-1' if levels & _LATIN1_MASK and not levels & _UTF8_MASK else 'utf-8')
+
+  def item(self):
+    flags = self._int()
+    sexptype = flags & 0xFF
+    levels = flags >> 12
+    has_attr = flags & (1 << 9)
+    has_tag = flags & (1 << 10)
+
+    if sexptype == _NILVALUE_SXP:
+      return None
+    if sexptype in _ENVIRONMENT_MARKERS:
+      return None
+    if sexptype == _REFSXP:
+      index = flags >> 8
+      if index == 0:
+        index = self._int()
+      return self._refs[index - 1]
+    if sexptype == _SYMSXP:
+      sym = _Symbol(self.item())
+      self._refs.append(sym)
+      return sym
+    if sexptype == _CHARSXP:
+      return self._charsxp(levels)
+    if sexptype in _PAIRLIST_TYPES:
+      attrs = self._attributes() if has_attr else None
+      tag = self.item() if has_tag else None
+      car = self.item()
+      cdr = self.item()
+      return RObject(sexptype, (tag, car, cdr), attrs)
+    if sexptype == _ALTREP_SXP:
+      return self._altrep()
+
+    if sexptype in (_LGLSXP, _INTSXP):
+      value = self._array('>i4', self._length(), 4)
+    elif sexptype == _REALSXP:
+      value = self._array('>f8', self._length(), 8)
+    elif sexptype == _CPLXSXP:
+      value = self._array('>f8', 2 * self._length(), 8).view('>c16')
+    elif sexptype == _STRSXP:
+      n = self._length()
+      value = np.empty(n, dtype=object)
+      for i in range(n):
+        value[i] = self.item()
+    elif sexptype in (_VECSXP, _EXPRSXP):
+      value = [self.item() for _ in range(self._length())]
+    elif sexptype == _RAWSXP:
+      value = np.frombuffer(self._bytes(self._length()), dtype=np.uint8)
+    else:
+      raise UnsupportedError('unsupported SEXP type: {t}'.format(t=sexptype))
+
+    attrs = self._attributes() if has_attr else None
+    return RObject(sexptype, value, attrs)
+
+  def _altrep(self):
+    info = self.item()
+    state = self.item()
+    attrs = self.item()
+    clazz = info.value[1].name if isinstance(info.value[1], _Symbol) else None
+    if clazz == 'compact_intseq' or clazz == 'compact_realseq':
+      n, start, step = state.value[0], state.value[1], state.value[2]
+      if clazz == 'compact_intseq':
+        value, sexptype = np.arange(int(n), dtype=np.int32) * int(step) + int(start), _INTSXP
+      else:
+        value, sexptype = np.arange(int(n), dtype=np.float64) * step + start, _REALSXP
+    elif clazz is not None and clazz.startswith('wrap_'):
+      # state: pairlist of the wrapped vector and its metadata
+      _, wrapped, _ = state.value
+      value, sexptype = wrapped.value, wrapped.sexptype
+    elif clazz == 'deferred_string':
+      # state: pairlist of the original numeric vector and the scipen option, e.g. as.character(1:n)
+      _, arg, info = state.value
+      scipen = int(info.value[0]) if isinstance(info, RObject) and len(info.value) else 0
+      value, sexptype = _deferred_strings(arg, scipen), _STRSXP
+    else:
+      raise UnsupportedError('unsupported ALTREP class: {c}'.format(c=clazz))
+    return RObject(sexptype, value, _pairlist_to_dict(attrs))
+
+
+def _format_real(x, scipen):
+  """
+  formats a double like R's as.character: 15 significant digits, scientific notation if it is shorter
+  """
+  if np.isnan(x):
+    return None if int(np.float64(x).view(np.uint64)) & 0xFFFFFFFF == _NA_REAL_PAYLOAD else 'NaN'
+  if np.isinf(x):
+    return 'Inf' if x > 0 else '-Inf'
+  if x == 0:
+    return '0'
+  mantissa, exponent = ('%.14e' % abs(x)).split('e')
+  digits = mantissa.replace('.', '').rstrip('0')
+  exponent = int(exponent)
+  sign = '-' if x < 0 else ''
+  scientific = '{s}{d}{f}e{e:+03d}'.format(s=sign, d=digits[0], f='.' + digits[1:] if len(digits) > 1 else '',
+                                           e=exponent)
+  fixed = sign + '%.*f' % (max(0, len(digits) - 1 - exponent), abs(x))
+  return fixed if len(fixed) <= len(scientific) + scipen else scientific
+
+
+def _deferred_strings(arg, scipen):
+  values = arg.value
+  if arg.sexptype == _REALSXP:
+    strings = [_format_real(v, scipen) for v in values]
+  else:
+    strings = [None if v == NA_INTEGER else str(v) for v in values.tolist()]
+  return np.array(strings, dtype=object)
+
+
+def parse(data):
+  """
+  parses the given serialized R object
+  :param data: the (optionally compressed) payload
+  :return: RObject
+  """
+  try:
+    r = _Reader(decompress(data))
+    r.header()
+    return r.item()
+  except UnsupportedError:
+    raise
+  except _MALFORMED as e:
+    raise UnsupportedError('malformed payload: {e}'.format(e=e))
+
+
+def _as_native(value):
+  if value.dtype.byteorder == '>':
+    return value.astype(value.dtype.newbyteorder('='))
+  return value
+
+
+def to_python(obj):
+  """
+  converts a parsed R object: numeric vectors to NumPy arrays (matrices are reshaped), factors to
+  pandas.Categorical, data frames to pandas.DataFrame and lists to Python lists or, if named, OrderedDicts
+  :param obj: RObject
+  :return:
+  """
+  if not isinstance(obj, RObject):
+    return obj
+  classes = obj.classes
+  value = obj.value
+
+  if 'data.frame' in classes:
+    import pandas as pd
+    from collections import OrderedDict
+    names = obj.attr('names')
+    return pd.DataFrame(OrderedDict((name, to_python(col)) for name, col in zip(names, value)))
+  if 'factor' in classes:
+    import pandas as pd
+    codes = _as_native(value)
+    codes = np.where(codes == NA_INTEGER, 0, codes) - 1
+    return pd.Categorical.from_codes(codes, obj.attr('levels'))
+  if isinstance(value, list):
+    names = obj.attr('names')
+    if names is not None:
+      from collections import OrderedDict
+      return OrderedDict((name, to_python(v)) for name, v in zip(names, value))
+    return [to_python(v) for v in value]
+  if obj.sexptype == _LGLSXP:
+    value = _as_native(value)
+    missing = value == NA_INTEGER
+    value = value.astype(bool)
+    if missing.any():
+      # like missing strings: an object array of True, False and None
+      value = value.astype(object)
+      value[missing] = None
+  elif isinstance(value, np.ndarray) and value.dtype != object:
+    value = _as_native(value)
+
+  dim = obj.attr('dim')
+  if dim is not None and isinstance(value, np.ndarray):
+    value = value.reshape(tuple(int(d) for d in dim), order='F')
+  return value
+
+
+def loads(data):
+  """
+  parses and converts the given serialized R object
+  :param data: the (optionally compressed) payload
+  :return: see to_python
+  """
+  obj = parse(data)
+  try:
+    return to_python(obj)
+  except UnsupportedError:
+    raise
+  except _MALFORMED as e:
+    raise UnsupportedError('malformed payload: {e}'.format(e=e))
@@ -0,0 +1,128 @@
+###############################################################################
+# Caleydo - Visualization for Molecular Biology - http://caleydo.org
+# Copyright (c) The Caleydo Team. All rights reserved.
+# Licensed under the new BSD license, available at http://caleydo.org/license
+###############################################################################
+"""
+tests of the in memory value cache
+"""
+
+import threading
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip('phovea_server.config')
+from phovea_data_opencpu.cache import ValueCache  # noqa: E402
+
+__author__ = 'Samuel Gratzl'
+
+
+def _value():
+  # 80 bytes
+  return np.zeros(10)
+
+
+def test_eviction_order():
+  c = ValueCache(250)
+  for key in ('a', 'b', 'c'):
+    c.put(('s', key), _value())
+  # a is the most recently used one afterwards, such that b is evicted first
+  assert c.get(('s', 'a')) is not None
+  c.put(('s', 'd'), _value())
+  assert c.peek(('s', 'b')) is None
+  assert all(c.peek(('s', key)) is not None for key in ('a', 'c', 'd'))
+  c.put(('s', 'e'), _value())
+  assert c.peek(('s', 'c')) is None
+  stats = c.stats()
+  assert stats['entries'] == 3
+  assert stats['bytes'] == 240
+  assert stats['evictions'] == 2
+
+
+def test_budget():
+  c = ValueCache(100)
+  c.put(('s', 'a'), _value())
+  # larger than the whole budget: returned but neither cached nor evicting others
+  assert len(c.put(('s', 'b'), np.zeros(20))) == 20
+  assert c.peek(('s', 'b')) is None
+  assert c.peek(('s', 'a')) is not None
+  # replacing an entry does not count it twice
+  c.put(('s', 'a'), _value())
+  assert c.stats()['bytes'] == 80
+
+
+def test_invalidate_session():
+  c = ValueCache(1000)
+  c.put(('s1', 'a'), _value())
+  c.put(('s2', 'a'), _value())
+  assert c.invalidate('s1') == 1
+  assert c.peek(('s1', 'a')) is None
+  assert c.peek(('s2', 'a')) is not None
+
+
+def test_single_flight():
+  c = ValueCache(1000)
+  started = threading.Event()
+  release = threading.Event()
+  calls = []
+
+  def loader():
+    calls.append(1)
+    started.set()
+    release.wait()
+    return _value()
+
+  results = []
+  leader = threading.Thread(target=lambda: results.append(c.get_or_load(('s', 'a'), loader)))
+  leader.start()
+  started.wait()
+  followers = [threading.Thread(target=lambda: results.append(c.get_or_load(('s', 'a'), loader))) for _ in range(4)]
+  for t in followers:
+    t.start()
+  time.sleep(0.05)
+  release.set()
+  for t in [leader] + followers:
+    t.join()
+  assert len(calls) == 1
+  assert len(results) == 5
+  assert all(r is results[0] for r in results)
+
+
+def test_single_flight_error():
+  c = ValueCache(1000)
+  started = threading.Event()
+  release = threading.Event()
+  calls = []
+
+  def failing():
+    calls.append(1)
+    started.set()
+    release.wait()
+    raise ValueError('broken')
+
+  errors = []
+
+  def load():
+    try:
+      c.get_or_load(('s', 'a'), failing)
+    except ValueError as e:
+      errors.append(e)
+
+  threads = [threading.Thread(target=load)]
+  threads[0].start()
+  started.wait()
+  threads.extend(threading.Thread(target=load) for _ in range(4))
+  for t in threads[1:]:
+    t.start()
+  time.sleep(0.05)
+  release.set()
+  for t in threads:
+    t.join()
+  # a single load whose error reaches every waiter
+  assert len(calls) == 1
+  assert len(errors) == 5
+  # errors are not cached, the next call loads again
+  assert c.peek(('s', 'a')) is None
+  assert c.get_or_load(('s', 'a'), _value) is not None
+  assert c.peek(('s', 'a')) is not None
@@ -0,0 +1,145 @@
+###############################################################################
+# Caleydo - Visualization for Molecular Biology - http://caleydo.org
+# Copyright (c) The Caleydo Team. All rights reserved.
+# Licensed under the new BSD license, available at http://caleydo.org/license
+###############################################################################
+"""
+tests of the data provider that do not need an OpenCPU server
+"""
+
+import json
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('phovea_server.config')
+from phovea_data_opencpu import data_provider, rds  # noqa: E402
+
+__author__ = 'Samuel Gratzl'
+
+_data = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def _load(name):
+  with open(os.path.join(_data, name), 'rb') as f:
+    return rds.loads(f.read())
+
+
+def _assert_same(a, b):
+  assert a.dtype == b.dtype
+  assert a.shape == b.shape
+  for x, y in zip(a, b):
+    assert x == y or (x is None and y is None) or (np.isnan(x) and np.isnan(y))
+
+
+def test_to_frame_parity():
+  # what jsonlite writes for data/dataframe_with_na_v3.rds, NA values are omitted
+  records = json.loads('[{"int":10,"float":1.1,"string":"x","bool":true},'
+                       '{"int":20,"float":2.2,"string":"y","bool":false},'
+                       '{"int":30,"float":3.3,"string":"z","bool":true},{}]')
+  column_types = [('int', 'int', None), ('float', 'real', None), ('string', 'string', None), ('bool', 'string', None)]
+  from_rds = data_provider._to_frame(_load('dataframe_with_na_v3.rds'), column_types)
+  from_json = data_provider._to_frame(records, column_types)
+  for name, _, _ in column_types:
+    _assert_same(from_rds[name].values, from_json[name].values)
+  assert list(from_rds['bool']) == [True, False, True, None]
+
+
+def test_to_typed_parity():
+  logicals = _load('dataframe_gzip_v3.rds')['ZZZ'].values
+  _assert_same(data_provider._to_typed(logicals, 'string'), data_provider._to_typed(logicals.tolist(), 'string'))
+  assert data_provider._to_typed(logicals.tolist(), 'string').dtype == bool
+
+  factor = data_provider._to_typed(_load('factor_na_v3.rds'), 'categorical', ['a', 'b'])
+  assert list(factor.codes) == list(data_provider._to_typed(['a', None, 'b'], 'categorical', ['a', 'b']).codes)
+
+  _assert_same(data_provider._to_typed(_load('compact_intseq_v3.rds'), 'int'),
+               data_provider._to_typed(list(range(1000)), 'int'))
+
+
+class _Manager(object):
+  """
+  id manager assigning consecutive ids that records the names it is asked for
+  """
+
+  def __init__(self):
+    self.ids = dict()
+    self.calls = []
+
+  def __call__(self, names, idtype):
+    self.calls.append(list(names))
+    return [self.ids.setdefault(n, len(self.ids)) for n in names]
+
+
+def test_id_map_unseen_names():
+  manager = _Manager()
+  id_map = data_provider.IDMap('Gene', manager)
+  assert list(id_map(['a', 'b', 'a'])) == [0, 1, 0]
+  assert manager.calls == [['a', 'b']]
+  # known names are resolved locally
+  assert list(id_map(['b', 'a'])) == [1, 0]
+  assert len(manager.calls) == 1
+  # only the unseen ones are sent, once each
+  assert list(id_map(['c', 'a', 'd', 'c'])) == [2, 0, 3, 2]
+  assert manager.calls[1:] == [['c', 'd']]
+  assert len(id_map([])) == 0
+  assert len(manager.calls) == 2
+
+
+class _Config(object):
+  def __init__(self, **kwargs):
+    self.__dict__.update(kwargs)
+
+  def __getattr__(self, name):
+    return None
+
+
+class _Session(object):
+  """
+  session without datasets that does not need an OpenCPU server
+  """
+
+  def __init__(self, desc):
+    self._desc = desc
+    self.name = desc['name']
+    self.hash = data_provider.session_hash(desc)
+
+  def __iter__(self):
+    return iter([])
+
+
+def test_rediscover(monkeypatch):
+  mtimes = dict(a=1, b=1)
+  pruned = []
+
+  def discover_sessions(discover):
+    return [dict(name=f, script="load('{f}')".format(f=f), file=f, mtime=m, discovered=True)
+            for f, m in sorted(mtimes.items())]
+
+  monkeypatch.setattr(data_provider, 'config', _Config(discover=dict(function='list.files')))
+  monkeypatch.setattr(data_provider, 'discover_sessions', discover_sessions)
+  monkeypatch.setattr(data_provider, 'create_sessions', lambda descs: [_Session(d) for d in descs])
+  monkeypatch.setattr(data_provider, '_prune_persisted', lambda hashes: pruned.append(set(hashes)))
+
+  p = data_provider.OpenCPUProvider()
+  before = dict(p._discovered)
+  assert list(before) == ['a', 'b']
+  values = data_provider.cache.values()
+  for s in before.values():
+    values.put((s.hash, 'x', 'values'), np.zeros(1))
+
+  mtimes.update(b=2, c=1)
+  del mtimes['a']
+  assert p.rediscover() == dict(added=['c'], updated=['b'], removed=['a'])
+  assert list(p._discovered) == ['b', 'c']
+  assert p._discovered['b'] is not before['b']
+  assert p._discovered['b'].hash != before['b'].hash
+  assert [s.name for s in p._index.sessions] == ['b', 'c']
+  # the values and persisted data of retired sessions are dropped
+  assert all(values.peek((s.hash, 'x', 'values')) is None for s in before.values())
+  assert pruned[-1] == set(s.hash for s in p._discovered.values())
+
+  # unchanged files keep their sessions
+  current = dict(p._discovered)
+  assert p.rediscover() == dict(added=[], updated=[], removed=[])
+  assert all(p._discovered[f] is s for f, s in current.items())
@@ -0,0 +1,148 @@
+###############################################################################
+# Caleydo - Visualization for Molecular Biology - http://caleydo.org
+# Copyright (c) The Caleydo Team. All rights reserved.
+# Licensed under the new BSD license, available at http://caleydo.org/license
+###############################################################################
+"""
+tests of the rds reader against files written by R, see data/README.md
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from phovea_data_opencpu import rds
+
+__author__ = 'Samuel Gratzl'
+
+_data = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def _load(name):
+  with open(os.path.join(_data, name), 'rb') as f:
+    return f.read()
+
+
+def _loads(name):
+  return rds.loads(_load(name))
+
+
+def test_gzip_v2():
+  data = _load('dataframe_gzip_v2.rds')
+  assert data[:2] == b'\x1f\x8b'
+  df = rds.loads(data)
+  assert list(df.columns) == ['class', 'value']
+  assert list(df['class']) == ['a', 'b', 'b']
+  assert list(df['value']) == [1, 2, 3]
+
+
+def test_gzip_v3():
+  data = _load('factor_gzip_v3.rds')
+  assert data[:2] == b'\x1f\x8b'
+  f = rds.loads(data)
+  assert isinstance(f, pd.Categorical)
+  assert list(f.categories) == ['chr1', 'chr2', 'chr3']
+  assert list(f.codes) == [0, 1, 0, 2]
+
+
+def test_na_string():
+  for name in ('na_string_v2.rds', 'na_string_v3.rds'):
+    v = _loads(name)
+    assert v.dtype == object
+    assert list(v) == [None]
+
+
+def test_factor():
+  f = _loads('factor_v3.rds')
+  assert list(f.categories) == ['a', 'b']
+  assert list(f.codes) == [0, 1, 1]
+
+
+def test_factor_na():
+  f = _loads('factor_na_v3.rds')
+  assert list(f.categories) == ['a', 'b']
+  assert list(f.codes) == [0, -1, 1]
+
+
+def test_logical_na():
+  v = _loads('logical_na_gzip_v3.rds')
+  assert v.shape == (999,)
+  assert v.dtype == object
+  assert sum(x is None for x in v) == 10
+  assert set(v) == {True, False, None}
+
+
+def test_dataframe():
+  df = _loads('dataframe_gzip_v3.rds')
+  assert list(df.columns) == ['xxx', 'YYY', 'ZZZ']
+  assert df.shape == (19, 3)
+  assert df['xxx'].dtype == np.float64
+  assert ((df['xxx'] >= 0) & (df['xxx'] <= 1)).all()
+  assert df['ZZZ'].dtype == bool
+  assert all(len(v) == 1 for v in df['YYY'])
+
+
+def test_dataframe_with_na():
+  df = _loads('dataframe_with_na_v3.rds')
+  assert list(df.columns) == ['int', 'float', 'string', 'bool', 'complex']
+  # integer NAs are kept as NA_INTEGER, the provider converts them using the column type
+  assert list(df['int']) == [10, 20, 30, rds.NA_INTEGER]
+  np.testing.assert_array_equal(df['float'], [1.1, 2.2, 3.3, np.nan])
+  assert list(df['string'][:3]) == ['x', 'y', 'z']
+  assert pd.isnull(df['string'][3])
+  assert list(df['bool']) == [True, False, True, None]
+  assert list(df['complex'][:3]) == [4 + 5j, 6 + 7j, 8 + 9j]
+
+
+def test_matrix():
+  m = _loads('matrix_v3.rds')
+  assert m.dtype == np.int32
+  np.testing.assert_array_equal(m, [[1, 2, 3], [4, 5, 6]])
+
+
+def test_named_matrix():
+  obj = rds.parse(_load('named_matrix_v3.rds'))
+  np.testing.assert_array_equal(rds.to_python(obj), [[1, 2, 3], [4, 5, 6]])
+  dimnames = rds.to_python(obj.attributes['dimnames'])
+  assert list(dimnames.keys()) == ['my_dim_0', 'my_dim_1']
+  assert list(dimnames['my_dim_0']) == ['dim0_0', 'dim0_1']
+  assert list(dimnames['my_dim_1']) == ['dim1_0', 'dim1_1', 'dim1_2']
+
+
+def test_compact_intseq():
+  for name in ('compact_intseq_v2.rds', 'compact_intseq_v3.rds'):
+    v = _loads(name)
+    assert v.dtype == np.int32
+    np.testing.assert_array_equal(v, np.arange(1000))
+
+
+def test_deferred_string():
+  v = _loads('deferred_string_v3.rds')
+  assert v.dtype == object
+  assert list(v) == ['1', '2.3', '10000', '1e+05', '-10000', '-1e+05', '0.001', '1e-04', '1e-05']
+
+
+def test_wrap():
+  v = _loads('wrap_real_v3.rds')
+  assert v.dtype == np.float64
+  assert list(v) == [3.]
+  assert list(_loads('wrap_string_v3.rds')) == ['Hello']
+
+
+def test_malformed():
+  data = _load('factor_v3.rds')
+  for truncated in (data[:10], data[:40], data[:-10]):
+    try:
+      rds.loads(truncated)
+      assert False, 'expected UnsupportedError'
+    except rds.UnsupportedError:
+      pass
+
+
+def test_format_real():
+  assert rds._format_real(123456., 0) == '123456'
+  assert rds._format_real(0.1 + 0.2, 0) == '0.3'
+  assert rds._format_real(1e5, 1) == '100000'
+  assert rds._format_real(-np.inf, 0) == '-Inf'
+  assert rds._format_real(np.nan, 0) == 'NaN'
+  na = np.array([0x7FF00000000007A2], dtype=np.uint64).view(np.float64)[0]
+  assert rds._format_real(na, 0) is None